@@ -0,0 +1,269 @@
+import argparse
+import math
+import os
+import random
+import statistics
+from os.path import abspath
+from typing import List, Tuple
+import dbMan
+import compiler
+import runner
+import checkers
+import tester
+from CriticalExceptionM import CriticalException
+from colorama import Fore
+
+DEFAULT_RUNS = 10
+DEFAULT_WARMUPS = 2
+# percent a test has to get slower by before compare flags it, smaller differences are considered noise
+DEFAULT_THRESHOLD = 10
+# sizes with a median time below this many ms are left out of the complexity fit when possible, their time is mostly process startup
+MIN_FIT_TIME = 5
+
+
+class BenchResult:
+    'times holds the CPU time in ms of every measured run and memory is the max peak resident set size in KB over them.'
+    __slots__ = 'testId', 'times', 'memory', 'verdict'
+
+    def __init__(self, testId: str):
+        self.testId, self.times, self.memory, self.verdict = testId, [], 0, 'Accepted'
+
+    @property
+    def passed(self) -> bool:
+        return self.verdict == 'Accepted'
+
+    @property
+    def min(self) -> float:
+        return min(self.times)
+
+    @property
+    def median(self) -> float:
+        return statistics.median(self.times)
+
+    @property
+    def p95(self) -> float:
+        'Nearest rank 95th percentile.'
+        times = sorted(self.times)
+        return times[max(0, math.ceil(0.95 * len(times)) - 1)]
+
+    @property
+    def stddev(self) -> float:
+        return statistics.stdev(self.times) if len(self.times) > 1 else 0.0
+
+
+def benchTest(test: dbMan.Test, exe: list, runs: int, warmups: int, cpu: int, timeLimit: int, memoryLimit: int, check) -> BenchResult:
+    """The first warmup also checks the answer, tests that don't pass it aren't measured.
+    The input is loaded once and reused by every run."""
+    res = BenchResult(test.id)
+    input = test.input
+    tr = tester.TestResult.runTest(input, test.answer, exe, test.id, cpu=cpu, timeLimit=timeLimit, memoryLimit=memoryLimit, checker=check)
+    if tr.passed == False:
+        res.verdict = tr.verdict
+        return res
+    for _ in range(warmups - 1):
+        runner.run(exe, input, timeLimit, cpu)
+    for _ in range(runs):
+        proc = runner.run(exe, input, timeLimit, cpu)
+        if proc.timedOut:
+            res.verdict = 'Timedout'
+        res.times.append(proc.cpuTimeUs / 1000)
+        res.memory = max(res.memory, proc.peakMemory)
+    return res
+
+
+def _formatRow(cells: list) -> str:
+    return f'{cells[0]:<10}' + ''.join(f'{c:>12}' for c in cells[1:])
+
+
+def printSummary(results: List[BenchResult]):
+    measured = [r for r in results if len(r.times) > 0]
+    if len(measured) > 0:
+        print(_formatRow(['Test', 'Min ms', 'Median ms', 'P95 ms', 'Stddev ms', 'Memory KB']))
+        for r in measured:
+            print(_formatRow([r.testId, f'{r.min:.2f}', f'{r.median:.2f}', f'{r.p95:.2f}', f'{r.stddev:.2f}', r.memory]))
+        print(_formatRow(['Total', f'{sum(r.min for r in measured):.2f}', f'{sum(r.median for r in measured):.2f}', '', '', max(r.memory for r in measured)]))
+        slowest = max(measured, key=lambda r: r.median)
+        print(f'Slowest test is {slowest.testId} with a median of {slowest.median:.2f}ms')
+    for r in results:
+        if r.passed == False:
+            print(f'Test {r.testId}: {Fore.RED}{r.verdict}{Fore.RESET}')
+
+
+def benchProblem(userId: str, sourcePath: str, cfTestsIds: List[int] = None, uTestsIds: List[int] = None, runs: int = DEFAULT_RUNS, warmups: int = DEFAULT_WARMUPS,
+                 cpu: int = None, timeLimit: int = None, memoryLimit: int = None, checker: str = None) -> List[BenchResult]:
+    """Runs each test warmups times then measures it runs times, tests run one at a time so they don't disturb each other.
+    If cpu is provided then the solution is pinned to that core.
+    The median time of every passed test is recorded in the db under the source hash."""
+    if runs <= 0:
+        raise CriticalException('Number of runs must be positive.')
+    prob = dbMan.Problem.getByUserId(userId)
+    if prob == None:
+        raise CriticalException(f'There is no problem with id: {userId} in db.')
+    check = checkers.getChecker(checker)
+    timeLimit, memoryLimit = tester.problemLimits(prob, timeLimit, memoryLimit)
+    sourcePath = abspath(sourcePath)
+    exe = compiler.compile(sourcePath)
+    ts = dbMan.TestSet(prob.id, cfTestsIds, uTestsIds)
+    if len(ts) == 0:
+        print(f'{Fore.RED}No tests where found{Fore.RESET}')
+        return []
+    print(f'Benchmarking {len(ts)} tests, {warmups} warmups and {runs} runs each' + ('' if cpu == None else f' pinned to core {cpu}'))
+    results = [benchTest(t, exe, runs, max(1, warmups), cpu, timeLimit, memoryLimit, check) for t in ts]
+    printSummary(results)
+    dbMan.RunResult.record(prob.id, compiler.sourceHash(sourcePath), [(r.testId, r.median, r.memory) for r in results if r.passed])
+    return results
+
+
+def compareProblem(userId: str, sourcePath: str, against: str = 'previous', threshold: float = DEFAULT_THRESHOLD, rerun: bool = False,
+                   cfTestsIds: List[int] = None, uTestsIds: List[int] = None, runs: int = DEFAULT_RUNS, warmups: int = DEFAULT_WARMUPS,
+                   cpu: int = None, timeLimit: int = None, memoryLimit: int = None, checker: str = None):
+    """Compares the latest recorded results of the source with the previous or best results of other sources of the problem,
+    the source is benchmarked first if it has no recorded results or rerun is True.
+    Tests slower than the baseline by more than threshold percent are flagged."""
+    prob = dbMan.Problem.getByUserId(userId)
+    if prob == None:
+        raise CriticalException(f'There is no problem with id: {userId} in db.')
+    srcHash = compiler.sourceHash(abspath(sourcePath))
+    current = dbMan.RunResult.latest(prob.id, srcHash)
+    if rerun or len(current) == 0:
+        benchProblem(userId, sourcePath, cfTestsIds, uTestsIds, runs, warmups, cpu, timeLimit, memoryLimit, checker)
+        current = dbMan.RunResult.latest(prob.id, srcHash)
+    baseline = dbMan.RunResult.best(prob.id, srcHash) if against == 'best' else dbMan.RunResult.previous(prob.id, srcHash)
+    common = sorted((t for t in current.keys() if t in baseline), key=tester.testIdKey)
+    if len(common) == 0:
+        print(f'{Fore.RED}No {against} results of other sources to compare with{Fore.RESET}')
+        return
+    print(f'Comparing against the {against} results of other sources, tests slower by more than {threshold}% are flagged')
+    print(_formatRow(['Test', 'Base ms', 'Current ms', 'Speedup']))
+    slower, faster = 0, 0
+    for t in common:
+        base, cur = baseline[t].cpuTime, current[t].cpuTime
+        flag = ''
+        if cur > base * (1 + threshold / 100):
+            slower, flag = slower + 1, f'{Fore.RED}slower{Fore.RESET}'
+        elif base > cur * (1 + threshold / 100):
+            faster, flag = faster + 1, f'{Fore.GREEN}faster{Fore.RESET}'
+        print(f"{_formatRow([t, f'{base:.2f}', f'{cur:.2f}', _speedup(base, cur)])} {flag}")
+    base, cur = sum(baseline[t].cpuTime for t in common), sum(current[t].cpuTime for t in common)
+    print(_formatRow(['Total', f'{base:.2f}', f'{cur:.2f}', _speedup(base, cur)]))
+    print(f'{slower} tests got {Fore.RED}slower{Fore.RESET}, {faster} got {Fore.GREEN}faster{Fore.RESET} and {len(common) - slower - faster} are within the noise')
+
+
+def _speedup(base: float, cur: float) -> str:
+    return f'x{base / cur:.2f}' if cur > 0 else '-'
+
+
+def _formatTime(ms: float) -> str:
+    return f'{ms:.2f}ms' if ms < 1000 else f'{ms / 1000:.2f}s'
+
+
+def scale(sourcePath: str, generatorPath: str, minSize: int = 1000, maxSize: int = 200000, factor: float = 2, runs: int = 3, predictSize: int = None,
+          seed: int = None, cpu: int = None, timeLimit: int = tester.DEFAULT_TIME_LIMIT) -> Tuple[float, float]:
+    """Times the solution on generator inputs of sizes minSize, minSize * factor, ... up to maxSize and fits time = c * n^k using a log-log linear regression.
+    The generator receives --size n along with --seperator and prints the test case first, the seed is passed in CFTESTER_SEED like stress tests.
+    Growing stops once a size exceeds timeLimit and a solution that crashes stops the run, returns the exponent k and the predicted time in ms at predictSize which is maxSize by default."""
+    if minSize <= 0 or maxSize < minSize or factor <= 1:
+        raise CriticalException('Sizes must be positive, maxSize must be at least minSize and factor must be more than 1.')
+    exe, gen = compiler.compileAll(abspath(sourcePath), abspath(generatorPath))
+    seed = random.randrange(1 << 31) if seed == None else seed
+    predictSize = maxSize if predictSize == None else predictSize
+    sizes, n = [], float(minSize)
+    while round(n) < maxSize:
+        sizes.append(round(n))
+        n *= factor
+    sizes.append(maxSize)
+
+    print(f'Timing {len(sizes)} sizes from {minSize} to {maxSize}, {runs} runs each, using seed {seed}')
+    print(_formatRow(['Size', 'Median ms', 'Min ms']))
+    points = []
+    for n in sizes:
+        genProc = runner.runPinned(gen + ['--seperator', tester.SEPARATOR, '--size', str(n)], cpu=cpu, timeout=tester.HELPER_TIMEOUT, check=True,
+                                   stderr=None, env=dict(os.environ, CFTESTER_SEED=str(seed)))
+        input = genProc.stdout.split(tester.SEPARATOR.encode('utf8'), 1)[0]
+        times, timedOut = [], False
+        for _ in range(runs):
+            proc = runner.run(exe, input, timeLimit, cpu)
+            if proc.timedOut:
+                timedOut = True
+                break
+            # a crashed run isn't a timing of the solution so it must not reach the fit
+            if proc.returnCode != 0:
+                raise CriticalException(f'The solution exited with code {proc.returnCode} on size {n}, stopping.\n{proc.stdout}'.strip())
+            times.append(proc.cpuTimeUs / 1000)
+        if timedOut:
+            print(f'{Fore.RED}Size {n} exceeded the time limit of {timeLimit}ms{Fore.RESET}, stopping')
+            break
+        points.append((n, statistics.median(times)))
+        print(_formatRow([n, f'{points[-1][1]:.2f}', f'{min(times):.2f}']))
+
+    fitted = [p for p in points if p[1] >= MIN_FIT_TIME]
+    if len(fitted) < 2:
+        fitted = [p for p in points if p[1] > 0]
+    if len(fitted) < 2:
+        raise CriticalException('Need at least 2 timed sizes to estimate the complexity, try larger sizes.')
+    slope, intercept = statistics.linear_regression([math.log(p[0]) for p in fitted], [math.log(p[1]) for p in fitted])
+    predicted = math.exp(intercept) * predictSize ** slope
+    color = Fore.RED if predicted > timeLimit else Fore.GREEN
+    print(f'Estimated complexity is about n^{slope:.2f}, predicted {color}{_formatTime(predicted)}{Fore.RESET} at n={predictSize:g} (time limit {timeLimit}ms), '
+          f'fitted on {len(fitted)} sizes')
+    return slope, predicted
+
+
+def cmd(args: argparse.Namespace) -> bool:
+    if args.subparserName == 'bench':
+        cfTestsIds = tester.splitTestsIds(args.cfTests) if args.cfTests else None
+        uTestsIds = tester.splitTestsIds(args.uTests) if args.uTests else None
+        benchProblem(args.problemId, args.source, cfTestsIds, uTestsIds, args.runs, args.warmups, args.cpu, args.timeLimit, args.memoryLimit, args.checker)
+        return True
+    if args.subparserName == 'compare':
+        cfTestsIds = tester.splitTestsIds(args.cfTests) if args.cfTests else None
+        uTestsIds = tester.splitTestsIds(args.uTests) if args.uTests else None
+        compareProblem(args.problemId, args.source, args.against, args.threshold, args.rerun, cfTestsIds, uTestsIds, args.runs, args.warmups, args.cpu,
+                       args.timeLimit, args.memoryLimit, args.checker)
+        return True
+    if args.subparserName == 'scale':
+        scale(args.source, args.generator, args.minSize, args.maxSize, args.factor, args.runs, args.predict, args.seed, args.cpu, args.timeLimit)
+        return True
+    return False
+
+
+def _addBenchArguments(p: argparse.ArgumentParser):
+    tester.addTestsArguments(p)
+    p.add_argument('--runs', type=int, default=DEFAULT_RUNS, help=f'Measured runs of each test, by default its {DEFAULT_RUNS}.')
+    p.add_argument('--warmups', type=int, default=DEFAULT_WARMUPS,
+                   help=f'Unmeasured runs before measuring each test, the first one also checks the answer, by default its {DEFAULT_WARMUPS}.')
+    p.add_argument('--cpu', type=int, help='Core to pin the solution to.')
+    dbMan.addLimitsArguments(p)
+    p.add_argument('--checker', default='exact', help='Built-in checker used to check the answer: ' + ', '.join(checkers.CHECKERS.keys()))
+
+
+def addParser(p: argparse._SubParsersAction):
+    pBench = p.add_parser('bench', description='Measures the CPU time of your solution on saved tests by running each test many times one at a time, '
+                          'the median time of each test is recorded in the db.')
+    pBench.add_argument('problemId', help='Id of the problem to benchmark.')
+    pBench.add_argument('source', help='Path to your solution file.')
+    _addBenchArguments(pBench)
+
+    pCompare = p.add_parser('compare', description='Compares the recorded bench results of your solution with the results of other versions of it.')
+    pCompare.add_argument('problemId', help='Id of the problem to compare.')
+    pCompare.add_argument('source', help='Path to your solution file, its benchmarked first if it has no recorded results.')
+    pCompare.add_argument('--against', choices=['previous', 'best'], default='previous',
+                          help='Compare with the latest or fastest result of each test from other sources, by default its previous.')
+    pCompare.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                          help=f'Percent a test has to get slower or faster by to be flagged, by default its {DEFAULT_THRESHOLD}%%.')
+    pCompare.add_argument('--rerun', action='store_true', help='Benchmark the source again even if it has recorded results.')
+    _addBenchArguments(pCompare)
+
+    pScale = p.add_parser('scale', description='Estimates the time complexity of your solution by timing it on generated inputs of growing sizes.')
+    pScale.add_argument('source', help='Path to your solution file.')
+    pScale.add_argument('generator',
+                        help='Path to your generator file, it receives the input size in argument --size and must print the test case first followed by argument --seperator, like stress test generators.')
+    pScale.add_argument('--minSize', type=int, default=1000, help='First input size, by default its 1000.')
+    pScale.add_argument('--maxSize', type=int, default=200000, help='Last input size, by default its 200000.')
+    pScale.add_argument('--factor', type=float, default=2, help='Each size is the previous one multiplied by factor, by default its 2.')
+    pScale.add_argument('--runs', type=int, default=3, help='Runs of each size, the median time is used, by default its 3.')
+    pScale.add_argument('--predict', type=int, help='Size to predict the time of, by default its maxSize.')
+    pScale.add_argument('--seed', type=int, help='Seed passed to the generator in the environment variable CFTESTER_SEED, by default its random.')
+    pScale.add_argument('--cpu', type=int, help='Core to pin the solution to.')
+    pScale.add_argument('--timeLimit', type=int, default=tester.DEFAULT_TIME_LIMIT,
+                        help=f'Time limit in ms of CPU time, sizes stop growing once its exceeded, by default its {tester.DEFAULT_TIME_LIMIT}ms.')
@@ -0,0 +1,203 @@
+import re
+from collections import Counter
+from typing import Tuple
+from CriticalExceptionM import CriticalException
+import runner
+
+# In-process checkers, each one is created with the expected answer then fed the solution output in chunks as its produced,
+# finish returns whether the output is accepted and a comment explaining why not.
+
+_whitespace = b' \t\n\r\x0b\x0c'
+_tokenRegex = re.compile(rb'\S+')
+
+
+def _answerBuffer(answer) -> memoryview:
+    'Accepts str, bytes-like or binary file answers.'
+    if answer == None:
+        return memoryview(b'')
+    if isinstance(answer, str):
+        answer = answer.encode('utf8')
+    view = runner.asBuffer(answer)
+    return memoryview(answer.read()) if view == None else view
+
+
+def _shorten(token: bytes) -> str:
+    token = token.decode('utf8', errors='replace')
+    return token if len(token) <= 64 else f'{token[:61]}...'
+
+
+class _TokenStream:
+    'Splits chunks into whitespace separated tokens, a token cut by a chunk boundary is held back until its rest arrives.'
+    __slots__ = '_partial'
+
+    def __init__(self):
+        self._partial = b''
+
+    def feed(self, chunk: bytes) -> list:
+        tokens = (self._partial + chunk).split()
+        if len(tokens) > 0 and len(chunk) > 0 and chunk[-1] not in _whitespace:
+            self._partial = tokens.pop()
+        else:
+            self._partial = b''
+        return tokens
+
+    def finish(self) -> list:
+        tokens, self._partial = ([self._partial] if len(self._partial) > 0 else []), b''
+        return tokens
+
+
+class ExactChecker:
+    'Same as comparing the stripped output to the stripped answer.'
+
+    def __init__(self, answer):
+        ans = _answerBuffer(answer)
+        s, e = 0, len(ans)
+        while s < e and ans[s] in _whitespace:
+            s += 1
+        while e > s and ans[e - 1] in _whitespace:
+            e -= 1
+        self._answer, self._pos, self._started, self._pendingWhitespace, self._matches = ans[s:e], 0, False, b'', True
+
+    def feed(self, chunk: bytes):
+        if self._matches == False:
+            return
+        if self._started == False:
+            chunk = chunk.lstrip(_whitespace)
+            if len(chunk) == 0:
+                return
+            self._started = True
+        # trailing whitespace is held back until something follows it, because it may be the end of the output
+        chunk = self._pendingWhitespace + chunk
+        data = chunk.rstrip(_whitespace)
+        self._pendingWhitespace = chunk[len(data):]
+        if self._answer[self._pos:self._pos + len(data)] != data:
+            self._matches = False
+        self._pos += len(data)
+
+    def finish(self) -> Tuple[bool, str]:
+        if self._matches and self._pos == len(self._answer):
+            return True, None
+        return False, "Output doesn't match answer"
+
+
+class TokenChecker:
+    'Compares whitespace separated tokens, so spaces and line breaks between tokens are ignored.'
+
+    def __init__(self, answer):
+        self._expected = _tokenRegex.finditer(_answerBuffer(answer))
+        self._output = _TokenStream()
+        self._count, self._comment = 0, None
+
+    def _equal(self, found: bytes, expected: bytes) -> bool:
+        return found == expected
+
+    def _check(self, tokens: list):
+        for t in tokens:
+            if self._comment != None:
+                return
+            self._count += 1
+            expected = next(self._expected, None)
+            if expected == None:
+                self._comment = f'Output has more tokens than the answer, extra token #{self._count} is "{_shorten(t)}"'
+            elif self._equal(t, expected.group()) == False:
+                self._comment = f'Token #{self._count} differs, expected "{_shorten(expected.group())}" but found "{_shorten(t)}"'
+
+    def feed(self, chunk: bytes):
+        if self._comment == None:
+            self._check(self._output.feed(chunk))
+
+    def finish(self) -> Tuple[bool, str]:
+        self._check(self._output.finish())
+        if self._comment == None and next(self._expected, None) != None:
+            self._comment = f'Output has only {self._count} tokens, answer has more'
+        return self._comment == None, self._comment
+
+
+class CaseInsensitiveChecker(TokenChecker):
+    'Compares tokens ignoring their case, meant for YES/yes/Yes answers.'
+
+    def _equal(self, found: bytes, expected: bytes) -> bool:
+        return found.lower() == expected.lower()
+
+
+class FloatChecker(TokenChecker):
+    'Compares tokens as numbers with an absolute or relative error of at most eps, tokens that are not numbers are compared exactly.'
+
+    def __init__(self, answer, eps: float = 1e-6):
+        super().__init__(answer)
+        self._eps = eps
+
+    def _equal(self, found: bytes, expected: bytes) -> bool:
+        if found == expected:
+            return True
+        try:
+            f, e = float(found), float(expected)
+        except ValueError:
+            return False
+        if f != f or e != e:
+            return False
+        diff = abs(f - e)
+        return diff <= self._eps or diff <= self._eps * abs(e)
+
+
+class UnorderedLinesChecker:
+    'Accepts any order of the answer lines, trailing whitespace and empty lines are ignored.'
+
+    def __init__(self, answer):
+        self._remaining = Counter(l.rstrip(_whitespace) for l in bytes(_answerBuffer(answer)).split(b'\n') if len(l.strip(_whitespace)) > 0)
+        self._partial, self._comment = b'', None
+
+    def _check(self, line: bytes):
+        line = line.rstrip(_whitespace)
+        if self._comment != None or len(line.lstrip(_whitespace)) == 0:
+            return
+        if self._remaining[line] <= 0:
+            self._comment = f'Line "{_shorten(line)}" is not in the answer or appears more times than in it'
+        else:
+            self._remaining[line] -= 1
+
+    def feed(self, chunk: bytes):
+        if self._comment != None:
+            return
+        lines = (self._partial + chunk).split(b'\n')
+        self._partial = lines.pop()
+        for l in lines:
+            self._check(l)
+
+    def finish(self) -> Tuple[bool, str]:
+        self._check(self._partial)
+        if self._comment == None:
+            missing = sum(self._remaining.values())
+            if missing > 0:
+                self._comment = f'Output is missing {missing} lines of the answer'
+        return self._comment == None, self._comment
+
+
+CHECKERS = {
+    'exact': 'Compares the stripped output to the stripped answer.',
+    'tokens': 'Compares whitespace separated tokens.',
+    'float': 'Compares tokens as numbers with an absolute or relative error of at most EPS, use float:EPS to change it from 1e-6.',
+    'yesno': 'Compares tokens ignoring their case.',
+    'lines': 'Accepts the answer lines in any order.',
+}
+
+
+def getChecker(spec: str):
+    "Returns a function that creates a checker from an answer, spec is one of CHECKERS names and float takes an optional ':EPS'."
+    name, _, arg = (spec or 'exact').partition(':')
+    name = name.lower()
+    if name == 'exact':
+        return ExactChecker
+    if name == 'tokens':
+        return TokenChecker
+    if name == 'yesno':
+        return CaseInsensitiveChecker
+    if name == 'lines':
+        return UnorderedLinesChecker
+    if name == 'float':
+        try:
+            eps = 1e-6 if arg == '' else float(arg)
+        except ValueError:
+            raise CriticalException(f'Invalid float checker epsilon "{arg}".')
+        return lambda answer: FloatChecker(answer, eps)
+    raise CriticalException(f'Unknown checker "{spec}", available checkers are: {", ".join(CHECKERS.keys())}.')
@@ -2,71 +2,270 @@ import errno
 import random
 from CriticalExceptionM import CriticalException
 import os
-from typing import List
+from typing import List, Tuple
 import subprocess
 import time
 import hashlib
 import dbMan
+import forkserver
+import tracer
 import shutil
-import multiprocessing
+import json
+import argparse
+import logging
+import re
+import fcntl
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 tempBinariesDirectory = os.path.join(os.getcwd(), 'TempBinaries')
 gppCompiler = 'g++'
+gppFlags = ['-static', '-DONLINE_JUDGE', '-O2', '-std=c++17']
+DOTNET_FRAMEWORK = 'net5.0'
 lockFileName = 'TesterLock.lck'
+# MB, least recently used executables are evicted once the cached ones exceed it
+maxCacheSize = int(os.environ.get('CFTESTER_CACHE_SIZE', 2048))
+# entries of tempBinariesDirectory that aren't cached executables and must be left alone by gc
+_reservedEntries = {'CSharpProjects', 'pch'}
+# seconds after which gc considers a .tmp entry left behind by a crashed build, younger ones may still be written by another process
+TMP_ENTRY_AGE = 3600
+# cache keys of the executables this process returned, they may run until it exits so they are never evicted by it
+_inUse = set()
+_toolchains = {}
+_pchLock = threading.Lock()
+_pchDirs = {}
+_csprojTemplate = """<Project Sdk="Microsoft.NET.Sdk">
+  <PropertyGroup>
+    <OutputType>Exe</OutputType>
+    <TargetFramework>{framework}</TargetFramework>
+  </PropertyGroup>
+</Project>
+"""
+_dotnetEnv = dict(os.environ, DOTNET_CLI_TELEMETRY_OPTOUT='1', DOTNET_NOLOGO='1', DOTNET_SKIP_FIRST_TIME_EXPERIENCE='1')
+_stdcppInclude = re.compile(r'^\s*#\s*include\s*<bits/stdc\+\+\.h>', re.MULTILINE)
 
-if os.path.exists(tempBinariesDirectory) == False:
-    os.mkdir(tempBinariesDirectory)
 
+def _toolchainIdentity(ext: str) -> str:
+    'Compiler path and version, so upgrading or switching the compiler invalidates the cached executables.'
+    if ext not in _toolchains:
+        args = [gppCompiler, '--version'] if ext == '.cpp' else ['dotnet', '--version']
+        try:
+            version = subprocess.run(args, text=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT).stdout.strip()
+        except OSError:
+            version = ''
+        _toolchains[ext] = f'{shutil.which(args[0]) or args[0]}\n{version}'
+    return _toolchains[ext]
 
-def _compile_new_source(srcPath: str, srcHash: str) -> List[str]:
+
+def _cacheKey(srcHash: str, ext: str) -> str:
+    flags = gppFlags if ext == '.cpp' else [DOTNET_FRAMEWORK, 'Release']
+    key = json.dumps([srcHash, ext, flags, _toolchainIdentity(ext)])
+    return hashlib.md5(key.encode('utf8'), usedforsecurity=False).hexdigest()
+
+
+def _entrySize(path: str) -> int:
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+def _cacheEntry(exePath: str) -> str:
+    'The file or directory that holds a cached executable, C# executables live in a directory of their own.'
+    parent = os.path.dirname(exePath)
+    return parent if os.path.dirname(parent) == tempBinariesDirectory else exePath
+
+
+def _removeEntry(path: str):
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def _precompiledHeader() -> str:
+    """Builds bits/stdc++.h as a precompiled header once per flags and compiler, returns a directory to pass with -I so g++ picks it up.
+    Returns None if it can't be built, in which case sources are compiled normally."""
+    flags = [f for f in gppFlags if f != '-static']
+    key = hashlib.md5(json.dumps([flags, _toolchainIdentity('.cpp')]).encode('utf8'), usedforsecurity=False).hexdigest()
+    with _pchLock:
+        if key in _pchDirs:
+            return _pchDirs[key]
+        pchDir = os.path.join(tempBinariesDirectory, 'pch', key)
+        gch = os.path.join(pchDir, 'bits', 'stdc++.h.gch')
+        os.makedirs(os.path.dirname(gch), exist_ok=True)
+        # other tester processes may be building the same header
+        with open(os.path.join(pchDir, lockFileName), 'w') as lck:
+            fcntl.flock(lck, fcntl.LOCK_EX)
+            if os.path.exists(gch) == False:
+                p = subprocess.run([gppCompiler, '-x', 'c++', '-E', '-H', '-'] + flags, text=True, input='#include <bits/stdc++.h>\n',
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+                header = next((l.split(maxsplit=1)[1] for l in p.stderr.splitlines() if l.startswith('. ') and l.endswith('bits/stdc++.h')), None)
+                tmpGch = f'{gch}.{os.getpid()}.tmp'
+                if header == None or subprocess.run([gppCompiler, '-x', 'c++-header', header] + flags + ['-o', tmpGch],
+                                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL).returncode != 0:
+                    logging.warning("Couldn't build a precompiled header for bits/stdc++.h.")
+                    pchDir = None
+                else:
+                    os.replace(tmpGch, gch)
+        _pchDirs[key] = pchDir
+        return pchDir
+
+
+class _CSharpProject:
+    """Claims one of os.cpu_count() warm C# projects using OS file locks, so concurrent testers never share a project and the locks die with their owner.
+    If all of them are taken it blocks on one of them instead of spinning.
+    Projects are kept between compilations so dotnet only rebuilds what changed, and the MSBuild and compiler servers are reused."""
+
+    def __init__(self):
+        self.path, self.name, self._lock = None, None, None
+
+    def __enter__(self):
+        projectsDir = os.path.join(tempBinariesDirectory, 'CSharpProjects')
+        os.makedirs(projectsDir, exist_ok=True)
+        slots = os.cpu_count() or 1
+        for attempt, i in enumerate(list(range(slots)) + [os.getpid() % slots]):
+            lock = open(os.path.join(projectsDir, f'project{i}.lck'), 'w')
+            try:
+                # the last attempt blocks until that project is released
+                fcntl.flock(lock, fcntl.LOCK_EX if attempt == slots else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock.close()
+                continue
+            self._lock, self.name = lock, f'project{i}'
+            break
+        self.path = os.path.join(projectsDir, self.name)
+        try:
+            self._create()
+        except:
+            self.__exit__(None, None, None)
+            raise
+        return self
+
+    def __exit__(self, *args):
+        fcntl.flock(self._lock, fcntl.LOCK_UN)
+        self._lock.close()
+
+    @property
+    def _csproj(self) -> str:
+        return os.path.join(self.path, f'{self.name}.csproj')
+
+    def _create(self):
+        """Recreates the project unless _csprojTemplate wrote it, and removes sources other than Program.cs,
+        like the program.cs of older versions, since MSBuild compares names ignoring case and may build the stale one instead."""
+        csproj = _csprojTemplate.format(framework=DOTNET_FRAMEWORK)
+        if os.path.exists(self._csproj):
+            with open(self._csproj, 'r') as fs:
+                current = fs.read()
+            if current == csproj:
+                for f in os.listdir(self.path):
+                    if f.lower().endswith('.cs') and f != 'Program.cs':
+                        os.remove(os.path.join(self.path, f))
+                return
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.path)
+        with open(self._csproj, 'w') as fs:
+            fs.write(csproj)
+
+    def build(self, srcPath: str, outputDir: str) -> str:
+        'Builds srcPath inside the project then copies the output to outputDir, returns the executable path.'
+        shutil.copyfile(srcPath, os.path.join(self.path, 'Program.cs'), follow_symlinks=True)
+        args = ['dotnet', 'build', self._csproj, '-c', 'Release', '-f', DOTNET_FRAMEWORK, '-nodeReuse:true', '-p:UseSharedCompilation=true']
+        if os.path.exists(os.path.join(self.path, 'obj', 'project.assets.json')):
+            args.append('--no-restore')
+        p = subprocess.run(args, text=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=_dotnetEnv)
+        if p.returncode != 0:
+            print(p.stdout)
+            raise CriticalException(f"Couldn't build project '{self.path}'.")
+        buildDir = os.path.join(self.path, 'bin', 'Release', DOTNET_FRAMEWORK)
+        tmpDir = os.path.join(tempBinariesDirectory, f'{time.time_ns()}xyz{random.randint(1, 9999999)}.tmp')
+        shutil.copytree(buildDir, tmpDir)
+        _removeEntry(outputDir)
+        os.replace(tmpDir, outputDir)
+        exe = os.path.join(outputDir, f'{self.name}.exe')
+        # apphosts have no extension outside of windows
+        return exe if os.path.exists(exe) else os.path.join(outputDir, self.name)
+
+
+@tracer.traced('compile')
+def _compile_new_source(srcPath: str, srcHash: str, cacheKey: str) -> List[str]:
     "Compiles C# or C++ source code and adds it to the db."
+    os.makedirs(tempBinariesDirectory, exist_ok=True)
     ext = os.path.splitext(srcPath)[1].lower()
     exe = ''
     if ext == '.cpp':
-        exe = os.path.join(tempBinariesDirectory, f'{time.time_ns()}xyz{random.randint(1, 9999999)}.exe')
-        args = [gppCompiler,  srcPath, '-static',  '-DONLINE_JUDGE', '-O2', '-std=c++17', '-o', exe]
+        exe = os.path.join(tempBinariesDirectory, f'{cacheKey}.exe')
+        tmpExe = os.path.join(tempBinariesDirectory, f'{time.time_ns()}xyz{random.randint(1, 9999999)}.tmp')
+        args = [gppCompiler,  srcPath] + gppFlags + ['-o', tmpExe]
+        with open(srcPath, 'r') as srcStream:
+            if _stdcppInclude.search(srcStream.read()) != None:
+                pchDir = _precompiledHeader()
+                if pchDir != None:
+                    args += ['-I', pchDir]
         p = subprocess.run(args, text=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
         print(p.stdout)
         if p.returncode != 0:
             raise CriticalException(f"Couldn't compile file {srcPath} successfully")
+        os.replace(tmpExe, exe)
     elif ext == '.cs' or ext == '.csx':
-        DOTNET_FRAMEWORK = 'net5.0'
-        projectPath, projectName = '', ''
-        while True:
-            for i in range(os.cpu_count()):
-                projectName = f'project{i}'
-                projectPath = os.path.join(tempBinariesDirectory, 'CSharpProjects', projectName)
-                if os.path.exists(projectPath) == False:
-                    if subprocess.run(['dotnet', 'new', 'console', '-o', projectPath], text=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT).returncode != 0:
-                        raise CriticalException(f"Couldn't create a new C# project at '{projectPath}'.")
-                    break
-                lockPath = os.path.join(projectPath, lockFileName)
-                if os.path.exists(lockPath) == False:
-                    break
-                projectPath = ''
-            # a huge chance for a race condition
-            if projectPath != '':
-                break
-        lockPath = os.path.join(projectPath, lockFileName)
-        with open(lockPath, 'w') as fs:
-            fs.write(str(multiprocessing.current_process().ident))
-            fs.flush()
-        programPath = os.path.join(projectPath, 'program.cs')
-        shutil.copyfile(srcPath, programPath, follow_symlinks=True)
-        csprojPath = os.path.join(projectPath, f'{projectName}.csproj')
-        outputDir = os.path.join(tempBinariesDirectory, f'{time.time_ns()}xyz{random.randint(1, 9999999)}')
-        if subprocess.run(['dotnet', 'build', '-c', 'Release', '-f', DOTNET_FRAMEWORK, '-o', outputDir, csprojPath],
-                          text=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT).returncode != 0:
-            os.remove(lockPath)
-            raise CriticalException(f"Couldn't build project '{projectPath}'.")
-        os.remove(lockPath)
-        exe = os.path.join(outputDir, f'{projectName}.exe')
+        outputDir = os.path.join(tempBinariesDirectory, cacheKey)
+        with _CSharpProject() as project:
+            exe = project.build(srcPath, outputDir)
 
     with dbMan.getConnection() as con:
-        con.execute('INSERT INTO Executable (sourceHash, path) VALUES (:sourceHash, :path);', {'sourceHash': srcHash, 'path': exe})
+        con.execute('INSERT OR REPLACE INTO Executable (cacheKey, sourceHash, path, size, lastUsed) VALUES (:key, :sourceHash, :path, :size, :lastUsed);',
+                    {'key': cacheKey, 'sourceHash': srcHash, 'path': exe, 'size': _entrySize(_cacheEntry(exe)), 'lastUsed': time.time_ns()})
+    _inUse.add(cacheKey)
+    evict(maxCacheSize)
     return [exe]
 
 
+def evict(maxSize: int) -> int:
+    'Removes least recently used executables until the cached ones take at most maxSize MB, returns how many were removed, executables this process uses are kept.'
+    removed = 0
+    with dbMan.getConnection() as con:
+        total = con.execute('SELECT coalesce(sum(size), 0) FROM Executable').fetchone()[0]
+        for r in con.execute('SELECT cacheKey, path, size FROM Executable ORDER BY lastUsed').fetchall():
+            if total <= maxSize * 1024 * 1024:
+                break
+            if r['cacheKey'] in _inUse:
+                continue
+            _removeEntry(_cacheEntry(r['path']))
+            con.execute('DELETE FROM Executable WHERE cacheKey = :key', {'key': r['cacheKey']})
+            total -= r['size']
+            removed += 1
+    return removed
+
+
+def gc(maxSize: int = None) -> Tuple[int, int, int]:
+    """Removes Executable rows whose binaries are gone, binaries that no row points to, then evicts down to maxSize MB.
+    Returns the number of stale rows, orphaned binaries and evicted executables."""
+    stale, orphans = 0, 0
+    with dbMan.getConnection() as con:
+        known = set()
+        for r in con.execute('SELECT cacheKey, path FROM Executable').fetchall():
+            if os.path.exists(r['path']):
+                known.add(_cacheEntry(r['path']))
+            else:
+                con.execute('DELETE FROM Executable WHERE cacheKey = :key', {'key': r['cacheKey']})
+                stale += 1
+    if os.path.isdir(tempBinariesDirectory):
+        for e in os.listdir(tempBinariesDirectory):
+            path = os.path.join(tempBinariesDirectory, e)
+            # sources are downloaded solutions that are still being stress tested
+            if e in _reservedEntries or path in known or e.endswith('.cpp'):
+                continue
+            if e.endswith('.tmp'):
+                try:
+                    if time.time() - os.path.getmtime(path) < TMP_ENTRY_AGE:
+                        continue
+                except FileNotFoundError:
+                    continue
+            _removeEntry(path)
+            orphans += 1
+    return stale, orphans, evict(maxCacheSize if maxSize == None else maxSize)
+
+
+@tracer.traced('compile')
 def compile(srcPath: str) -> List[str]:
     "returns exe path and args that you must pass to exe"
     if os.path.exists(srcPath) == False:
@@ -77,17 +276,51 @@ def compile(srcPath: str) -> List[str]:
     if ext == '.exe' or ext == '.out':
         return [srcPath]
     elif ext == '.py':
-        return ['python', srcPath]
+        return forkserver.command(srcPath)
 
-    srcHash = ''
-    with open(srcPath, 'r') as srcStream:
-        src = srcStream.read()
-        srcHash = hashlib.md5(src.encode('utf8'), usedforsecurity=False).hexdigest()
+    srcHash = sourceHash(srcPath)
+    key = _cacheKey(srcHash, '.cs' if ext == '.csx' else ext)
     with dbMan.getConnection() as con:
-        exe = con.execute('SELECT path FROM Executable WHERE sourceHash = :srcHash', {'srcHash': srcHash}).fetchone()
+        exe = con.execute('SELECT path FROM Executable WHERE cacheKey = :key', {'key': key}).fetchone()
         if exe != None:
             if os.path.exists(exe['path']):
+                con.execute('UPDATE Executable SET lastUsed = :now WHERE cacheKey = :key', {'key': key, 'now': time.time_ns()})
+                _inUse.add(key)
                 return [exe['path']]
-            con.execute('DELETE FROM Executable WHERE sourceHash = :srcHash', {'srcHash': srcHash})
+            con.execute('DELETE FROM Executable WHERE cacheKey = :key', {'key': key})
+
+    return _compile_new_source(srcPath, srcHash, key)
+
+
+def compileAll(*srcPaths: str) -> List[List[str]]:
+    'Compiles all of the sources concurrently, results keep the order of the sources and None sources give None.'
+    with ThreadPoolExecutor(max_workers=max(1, len(srcPaths))) as ex:
+        return list(ex.map(lambda p: None if p == None else compile(p), srcPaths))
+
+
+def sourceHash(srcPath: str) -> str:
+    with open(srcPath, 'r') as srcStream:
+        return hashlib.md5(srcStream.read().encode('utf8'), usedforsecurity=False).hexdigest()
+
+
+def executableKey(srcPath: str) -> str:
+    'Identifies what running srcPath executes, so outputs of a source can be reused until it or the toolchain compiling it changes.'
+    ext = os.path.splitext(srcPath)[1].lower()
+    if ext in ('.exe', '.out', '.py'):
+        with open(srcPath, 'rb') as f:
+            return hashlib.md5(f.read(), usedforsecurity=False).hexdigest()
+    return _cacheKey(sourceHash(srcPath), '.cs' if ext == '.csx' else ext)
+
+
+def cmd(args: argparse.Namespace) -> bool:
+    if args.subparserName == 'gc':
+        stale, orphans, evicted = gc(args.maxSize)
+        print(f'Removed {stale} stale executable records, {orphans} orphaned binaries and evicted {evicted} executables')
+        return True
+    return False
+
 
-    return _compile_new_source(srcPath, srcHash)
+def addParser(p: argparse._SubParsersAction):
+    pGC = p.add_parser('gc', description='Removes orphaned binaries and stale executable records then evicts the least recently used executables to fit the cache size.')
+    pGC.add_argument('--maxSize', type=int,
+                     help='Cache size in MB, by default its the environment variable CFTESTER_CACHE_SIZE or 2048.')
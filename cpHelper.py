@@ -1,12 +1,28 @@
 import argparse
-from cgi import test
 import dbMan
+import compiler
 import tester
+import bench
+import tracer
 
 p = argparse.ArgumentParser()
+p.add_argument('--trace', metavar='PATH',
+               help='Record how long every phase of the command takes, like compiling, the generator, the solver, the solution, the validator and db access, and write it to PATH.')
+p.add_argument('--traceFormat', choices=tracer.FORMATS, default='chrome',
+               help='chrome writes a trace event file that chrome://tracing or ui.perfetto.dev can open, '
+               'summary writes the count, total, mean and max ms of every phase. By default its chrome.')
 pa = p.add_subparsers(dest='subparserName')
 dbMan.addParser(pa)
+compiler.addParser(pa)
 tester.addParser(pa)
+bench.addParser(pa)
 args = p.parse_args()
-if dbMan.cmd(args) == False:
-    tester.cmd(args)
\ No newline at end of file
+if args.trace != None:
+    tracer.enable()
+try:
+    with tracer.span(str(args.subparserName), 'command'):
+        if dbMan.cmd(args) == False and compiler.cmd(args) == False and bench.cmd(args) == False:
+            tester.cmd(args)
+finally:
+    if args.trace != None:
+        tracer.write(args.trace, args.traceFormat)
@@ -2,28 +2,160 @@ from typing import Dict, List, Tuple
 from CriticalExceptionM import CriticalException
 import sqlite3
 import os
-import requests
-import bs4
 import subprocess
-from sessionMan import cfSession
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import compiler
 import argparse
 import logging
+import threading
+import hashlib
+import zlib
+import mmap
+import contextlib
+import time
+import tracer
 DB_NAME = 'cfdb.sqlite'
+# test payloads larger than this many bytes are stored raw in their own file here so runs can memory map them
+BLOBS_DIRECTORY = 'TestBlobs'
+BLOB_THRESHOLD = 1 << 20
+_local = threading.local()
+_schemaReady = False
+_schemaLock = threading.Lock()
 
 
 def getConnection() -> sqlite3.Connection:
-    c = sqlite3.connect(DB_NAME)
-    c.row_factory = sqlite3.Row
-    c.execute('PRAGMA foreign_keys = ON')
+    """Returns the connection of the calling thread, its opened and tuned once then reused by every later call on the same thread,
+    so parallel workers each get their own connection and WAL lets them read while another one writes."""
+    c = getattr(_local, 'connection', None)
+    if c == None or _local.pid != os.getpid():
+        with tracer.span('connect', 'db'):
+            c = sqlite3.connect(DB_NAME, timeout=30, cached_statements=256)
+            c.row_factory = sqlite3.Row
+            c.execute('PRAGMA foreign_keys = ON')
+            c.execute('PRAGMA journal_mode = WAL')
+            c.execute('PRAGMA synchronous = NORMAL')
+            c.execute('PRAGMA cache_size = -16384')
+            c.execute('PRAGMA temp_store = MEMORY')
+            _ensureSchema(c)
+        _local.connection, _local.pid = c, os.getpid()
     return c
 
 
-if os.path.exists(DB_NAME) == False:
-    logging.info('Creating new database.')
+@contextlib.contextmanager
+def writeTransaction():
+    """Yields the thread connection inside a transaction that takes the write lock upfront,
+    so concurrent writers wait for each other instead of failing when a read inside the transaction went stale."""
+    con = getConnection()
+    if con.in_transaction:
+        con.commit()
+    with tracer.span('writeTransaction', 'db'):
+        con.execute('BEGIN IMMEDIATE')
+        try:
+            yield con
+            con.commit()
+        except BaseException:
+            con.rollback()
+            raise
+
+
+def _blobPath(hash: bytes) -> str:
+    name = hash.hex()
+    return os.path.join(BLOBS_DIRECTORY, name[:2], name)
+
+
+def payloadHash(data) -> bytes:
+    'Hash payloads are stored by, data is str or bytes.'
+    return hashlib.blake2b(data.encode('utf8') if isinstance(data, str) else data, digest_size=16).digest()
+
+
+@tracer.traced('db')
+def _storePayload(con: sqlite3.Connection, data: str) -> bytes:
+    """Stores data once by its content hash and returns the hash, None is kept as None.
+    Small payloads are zlib compressed into the db, large ones are written raw to a blob file."""
+    if data == None:
+        return None
+    raw = data.encode('utf8')
+    hash = payloadHash(raw)
+    if con.execute('SELECT 1 FROM Payload WHERE hash = ?', (hash,)).fetchone() != None:
+        return hash
+    if len(raw) > BLOB_THRESHOLD:
+        path = _blobPath(hash)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f'{path}.{os.getpid()}.{threading.get_ident()}.tmp', 'wb') as f:
+            f.write(raw)
+        os.replace(f.name, path)
+        con.execute('INSERT OR IGNORE INTO Payload(hash, size, data) VALUES(?, ?, NULL)', (hash, len(raw)))
+    else:
+        con.execute('INSERT OR IGNORE INTO Payload(hash, size, data) VALUES(?, ?, ?)', (hash, len(raw), zlib.compress(raw)))
+    return hash
+
+
+@tracer.traced('db')
+def loadPayload(hash: bytes):
+    'Returns a stored payload as str, or as a read only mmap if its stored in a blob file, None is kept as None.'
+    if hash == None:
+        return None
     with getConnection() as con:
-        con.executescript("""
+        r = con.execute('SELECT data FROM Payload WHERE hash = ?', (hash,)).fetchone()
+    if r == None:
+        raise CriticalException(f'Test payload {hash.hex()} is missing from db.')
+    if r[0] != None:
+        return zlib.decompress(r[0]).decode('utf8')
+    with open(_blobPath(hash), 'rb') as f:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _pruneOrphanPayloads(con: sqlite3.Connection):
+    'Removes payloads that no test or corpus case references anymore along with their blob files.'
+    orphans = """SELECT hash FROM Payload WHERE hash NOT IN (SELECT inputHash FROM Test UNION SELECT answerHash FROM Test WHERE answerHash IS NOT NULL
+                 UNION SELECT inputHash FROM Corpus UNION SELECT answerHash FROM Corpus UNION SELECT dataHash FROM Corpus WHERE dataHash IS NOT NULL)"""
+    for r in con.execute(f'{orphans} AND data IS NULL').fetchall():
+        try:
+            os.remove(_blobPath(r[0]))
+        except FileNotFoundError:
+            pass
+    con.execute(f'DELETE FROM Payload WHERE hash IN ({orphans})')
+
+
+def _executeScript(con: sqlite3.Connection, script: str):
+    'Runs the statements of script one by one, unlike executescript it never commits so they stay inside the open transaction.'
+    statement = ''
+    for part in script.split(';'):
+        statement += part + ';'
+        if sqlite3.complete_statement(statement):
+            con.execute(statement)
+            statement = ''
+
+
+def _migrateTestPayloads(con: sqlite3.Connection):
+    'Moves test inputs and answers out of the Test table into the deduplicated Payload table.'
+    _executeScript(con, """
+CREATE TABLE Payload (
+    hash BLOB NOT NULL PRIMARY KEY,
+    size INTEGER NOT NULL,
+    /*zlib compressed, NULL if its stored raw in a blob file*/
+    data BLOB
+);
+CREATE TABLE NewTest (
+    problemId INTEGER NOT NULL REFERENCES Problem(id),
+    id Text NOT NULL,
+    inputHash BLOB NOT NULL REFERENCES Payload(hash),
+    answerHash BLOB REFERENCES Payload(hash),
+    PRIMARY KEY(problemId, id)
+);
+    """)
+    for r in con.execute('SELECT * FROM Test'):
+        con.execute('INSERT INTO NewTest(problemId, id, inputHash, answerHash) VALUES(?, ?, ?, ?)',
+                    (r['problemId'], r['id'], _storePayload(con, r['input']), _storePayload(con, r['answer'])))
+    _executeScript(con, """
+DROP TABLE Test;
+ALTER TABLE NewTest RENAME TO Test;
+    """)
+
+
+# schema of a new db before any migration
+_schema = """
 CREATE TABLE Problem (
     id INTEGER PRIMARY KEY NOT NULL,
     userId TEXT NOT NULL UNIQUE,
@@ -48,91 +180,276 @@ CREATE TABLE Executable (
     sourceHash TEXT NOT NULL PRIMARY KEY,
     path TEXT NOT NULL
 );
-        """)
+"""
+
+# Each entry upgrades the db by one version, PRAGMA user_version holds the number of applied migrations.
+_migrations = [
+    """
+ALTER TABLE Problem ADD COLUMN timeLimit INTEGER DEFAULT(NULL);
+ALTER TABLE Problem ADD COLUMN memoryLimit INTEGER DEFAULT(NULL);
+    """,
+    """
+/*executables are cached by source, language, flags and compiler so old rows can't be trusted, their binaries are left for gc*/
+DROP TABLE Executable;
+CREATE TABLE Executable (
+    cacheKey TEXT NOT NULL PRIMARY KEY,
+    sourceHash TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL DEFAULT(0),
+    lastUsed INTEGER NOT NULL DEFAULT(0)
+);
+CREATE INDEX Executable_lastUsed ON Executable(lastUsed);
+    """,
+    _migrateTestPayloads,
+    """
+/*kind is CF or U and number is the rest of the id, so tests can be filtered and ordered using the index*/
+ALTER TABLE Test ADD COLUMN kind TEXT NOT NULL DEFAULT('');
+ALTER TABLE Test ADD COLUMN number INTEGER NOT NULL DEFAULT(0);
+UPDATE Test SET kind = CASE WHEN id LIKE 'CF%' THEN 'CF' ELSE 'U' END,
+                number = CAST(SUBSTR(id, CASE WHEN id LIKE 'CF%' THEN 3 ELSE 2 END) AS INTEGER);
+CREATE INDEX Test_kind_number ON Test(problemId, kind, number);
+    """,
+    """
+/*measured runs of solutions, cpuTime is in ms and memory in KB, rows of the same run share their timestamp*/
+CREATE TABLE RunResult (
+    problemId INTEGER NOT NULL REFERENCES Problem(id),
+    testId TEXT NOT NULL,
+    sourceHash TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    cpuTime REAL NOT NULL,
+    memory INTEGER NOT NULL,
+    PRIMARY KEY(problemId, testId, sourceHash, timestamp)
+);
+CREATE INDEX RunResult_source ON RunResult(problemId, sourceHash, timestamp);
+    """,
+    """
+/*outcomes of every test across test runs of any source, failRate and cpuTime (ms) are exponential moving averages so recent runs weigh more*/
+CREATE TABLE TestHistory (
+    problemId INTEGER NOT NULL REFERENCES Problem(id),
+    testId TEXT NOT NULL,
+    runs INTEGER NOT NULL,
+    failRate REAL NOT NULL,
+    cpuTime REAL NOT NULL,
+    PRIMARY KEY(problemId, testId)
+);
+    """,
+    """
+/*generated stress cases and the answer of the reference solver identified by solverKey, lastUsed is in ns since the epoch*/
+CREATE TABLE Corpus (
+    problemId INTEGER NOT NULL REFERENCES Problem(id),
+    solverKey TEXT NOT NULL,
+    inputHash BLOB NOT NULL REFERENCES Payload(hash),
+    answerHash BLOB NOT NULL REFERENCES Payload(hash),
+    dataHash BLOB REFERENCES Payload(hash),
+    lastUsed INTEGER NOT NULL,
+    PRIMARY KEY(problemId, solverKey, inputHash)
+);
+CREATE INDEX Corpus_lastUsed ON Corpus(problemId, lastUsed);
+    """,
+]
+
+
+def _ensureSchema(con: sqlite3.Connection):
+    'Creates the db or brings it up to date once per process, on the first connection so commands that never touch the db skip it.'
+    global _schemaReady
+    with _schemaLock:
+        if _schemaReady:
+            return
+        _inTransaction(con, _createSchema)
+        _migrate(con)
+        _schemaReady = True
+
+
+def _inTransaction(con: sqlite3.Connection, step):
+    """Runs step(con) inside a transaction that takes the write lock upfront and commits only if it completes,
+    so an interrupted step leaves the db as it was and other processes wait for it instead of running it too."""
+    if con.in_transaction:
+        con.commit()
+    con.execute('BEGIN IMMEDIATE')
+    try:
+        step(con)
+        con.commit()
+    except BaseException:
+        con.rollback()
+        raise
+
+
+def _createSchema(con: sqlite3.Connection):
+    if con.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'Problem'").fetchone() == None:
+        logging.info('Creating new database.')
+        _executeScript(con, _schema)
+
+
+def _migrate(con: sqlite3.Connection):
+    'Applies every pending migration in a transaction of its own along with its user_version bump.'
+    def step(con: sqlite3.Connection):
+        # another process may have applied it while this one waited for the write lock
+        version = con.execute('PRAGMA user_version').fetchone()[0]
+        if version != i:
+            return
+        logging.info(f'Migrating database to version {i + 1}.')
+        if callable(_migrations[i]):
+            _migrations[i](con)
+        else:
+            _executeScript(con, _migrations[i])
+        con.execute(f'PRAGMA user_version = {i + 1}')
+    for i in range(con.execute('PRAGMA user_version').fetchone()[0], len(_migrations)):
+        _inTransaction(con, step)
 
 
 class Problem:
-    __slots__ = ('id', 'userId', 'contestId', 'problemIdx')
+    'timeLimit is in ms of CPU time and memoryLimit is in MB, both may be None in which case the tester defaults are used.'
+    __slots__ = ('id', 'userId', 'contestId', 'problemIdx', 'timeLimit', 'memoryLimit')
 
-    def __init__(self, id: int):
-        with getConnection() as con:
-            r = con.execute('SELECT * FROM Problem WHERE id = :id', {'id': id}).fetchone()
-            self.id, self.userId, self.contestId, self.problemIdx = id, r['userId'], r['contestId'], r['problemIdx']
+    def __init__(self, id: int, r: sqlite3.Row = None):
+        'r is the problem row if its already fetched.'
+        if r == None:
+            with getConnection() as con:
+                r = con.execute('SELECT * FROM Problem WHERE id = :id', {'id': id}).fetchone()
+        self.id, self.userId, self.contestId, self.problemIdx = id, r['userId'], r['contestId'], r['problemIdx']
+        self.timeLimit, self.memoryLimit = r['timeLimit'], r['memoryLimit']
 
     @staticmethod
+    @tracer.traced('db')
     def getByUserId(userId: str):
         with getConnection() as con:
-            r = con.execute('SELECT id FROM Problem WHERE userId = :uid', {'uid': userId}).fetchone()
+            r = con.execute('SELECT * FROM Problem WHERE userId = :uid', {'uid': userId}).fetchone()
             if r == None:
                 logging.warning(f'Tried to retrive a non-existing problem with id: {userId}.')
                 return None
-            return Problem(r['id'])
+            return Problem(r['id'], r)
 
     @staticmethod
-    def addProblem(userId: str, contestId: int, problemIdx: str):
+    def addProblem(userId: str, contestId: int, problemIdx: str, timeLimit: int = None, memoryLimit: int = None):
         if problemIdx != None:
             problemIdx = problemIdx.upper()
         pid = 0
         with getConnection() as con:
-            pid = con.execute('INSERT INTO Problem(userId, contestId, problemIdx) VALUES(:uid, :cid, :pidx)',
-                              {'uid': userId, 'cid': contestId, 'pidx': problemIdx}).lastrowid
+            pid = con.execute('INSERT INTO Problem(userId, contestId, problemIdx, timeLimit, memoryLimit) VALUES(:uid, :cid, :pidx, :tl, :ml)',
+                              {'uid': userId, 'cid': contestId, 'pidx': problemIdx, 'tl': timeLimit, 'ml': memoryLimit}).lastrowid
 
         return Problem(pid)
 
+    @staticmethod
+    def setLimits(userId: str, timeLimit: int = None, memoryLimit: int = None):
+        'Only updates the provided limits.'
+        with getConnection() as con:
+            if con.execute('SELECT id FROM Problem WHERE userId = :uid', {'uid': userId}).fetchone() == None:
+                raise CriticalException(f'There is no problem with id: {userId} in db.')
+            con.execute('UPDATE Problem SET timeLimit = coalesce(:tl, timeLimit), memoryLimit = coalesce(:ml, memoryLimit) WHERE userId = :uid',
+                        {'uid': userId, 'tl': timeLimit, 'ml': memoryLimit})
+
     @staticmethod
     def getByContestId(contestId: int) -> list:
         with getConnection() as con:
-            return [Problem(r[0]) for r in con.execute('SELECT id FROM Problem WHERE contestId = :cid', {'cid': contestId}).fetchall()]
+            return [Problem(r['id'], r) for r in con.execute('SELECT * FROM Problem WHERE contestId = :cid', {'cid': contestId}).fetchall()]
 
     @staticmethod
-    def cfAddContest(contestId: int, problemUserIdPrefix: str = None) -> list:
+    def cfAddContest(contestId: int, problemUserIdPrefix: str = None, timeLimit: int = None, memoryLimit: int = None) -> list:
         if problemUserIdPrefix == None:
             problemUserIdPrefix = str(contestId)
             logging.info('No problem id orefix was supplied so will use contest id instead.')
-        probs = cfSession.get(f'https://codeforces.com/api/contest.standings?contestId={contestId}&from=1&count=1&showUnofficial=false').json()['result']['problems']
+        probs = _contestStandings(contestId)['problems']
         res = []
         for p in probs:
-            res.append(Problem.addProblem(f'{problemUserIdPrefix}{p["index"]}', contestId, p["index"]))
+            res.append(Problem.addProblem(f'{problemUserIdPrefix}{p["index"]}', contestId, p["index"], timeLimit, memoryLimit))
         logging.info(f'Added {len(res)} problems from contest {contestId} to db.')
         return res
 
 
 class Test:
-    'Answer may be None or whitespace because this is a generator & validator case'
-    __slots__ = ('problemId', 'id', 'input', 'answer')
+    """Answer may be None or whitespace because this is a generator & validator case.
+    Input and answer are loaded from db on every access as str, or read only mmaps for payloads stored in blob files."""
+    __slots__ = ('problemId', 'id', 'inputHash', 'answerHash')
 
     def __init__(self, r: sqlite3.Row):
-        self.problemId, self.id, self.input, self.answer = r['problemId'], r['id'], r['input'], r['answer']
+        self.problemId, self.id, self.inputHash, self.answerHash = r['problemId'], r['id'], r['inputHash'], r['answerHash']
+
+    @property
+    def input(self):
+        return loadPayload(self.inputHash)
+
+    @property
+    def answer(self):
+        return loadPayload(self.answerHash)
+
+
+# sessionMan and bs4 are imported by the functions that reach CF so commands that only work locally don't pay for loading them
+# submissions fetched per contest.status call while looking for an accepted submission
+STATUS_PAGE_SIZE = 1000
+
+
+def _contestTtl(contestStands: dict) -> float:
+    'The contest and problems of finished contests never change so they are cached forever.'
+    import sessionMan
+    return sessionMan.IMMUTABLE if contestStands['contest']['phase'].lower() == 'finished' else sessionMan.CACHE_TTL
 
 
 def _findAcceptedSub(contestId: int, problemIdx: str, contestStands: dict) -> int:
-    'Return id of a C++ accepted submission to the problem'
+    'Return id of a C++ accepted submission to the problem, the contest submissions are scanned a page at a time until one is found.'
     problemIdx = problemIdx.upper()
-    probs = contestStands['problems']
-    propOffset = next((i for i in range(len(probs)) if probs[i]['index'].upper() == problemIdx), -1)
-    if propOffset == -1:
+    if next((p for p in contestStands['problems'] if p['index'].upper() == problemIdx), None) == None:
         raise CriticalException(f"Can't find problem {problemIdx} in contest {contestId}")
-    probSolvers = [s['party']['members'][0]['handle']
-                   for s in contestStands['rows'] if s['problemResults'][propOffset]['points'] > 0]
-
-    def tryFindAcceptedSub(solverHandle: str) -> int:
-        solverSubs = cfSession.get(
-            f'https://codeforces.com/api/contest.status?contestId={contestId}&handle={solverHandle}&from=1&count=100000').json()['result']
-        return next((s['id'] for s in solverSubs if s['problem']['index'].upper() == problemIdx and s['verdict'] == 'OK' and s['programmingLanguage'].find('++') != -1), -1)
-
-    for h in probSolvers:
-        subId = tryFindAcceptedSub(h)
-        if subId != -1:
-            logging.info(f'Found a C++ accepted submission for problem {contestId}/{problemIdx} from user {h} with id: {subId}.')
-            return subId
+    import sessionMan
+    # the submission picked for a problem of a finished contest is kept so later loads don't scan the contest submissions again
+    cacheKey = f'acceptedSub {contestId} {problemIdx}'
+    res = sessionMan.cached(cacheKey)
+    if res != None:
+        return res.json()
+    first = 1
+    while True:
+        # practice submissions keep arriving newest first after a contest ends, so pages shift and are never cached for long
+        subs = sessionMan.getApi(f'/api/contest.status?contestId={contestId}&from={first}&count={STATUS_PAGE_SIZE}', sessionMan.CACHE_TTL)
+        sub = next((s for s in subs if s['problem']['index'].upper() == problemIdx and s['verdict'] == 'OK' and s['programmingLanguage'].find('++') != -1), None)
+        if sub != None:
+            logging.info(f'Found a C++ accepted submission for problem {contestId}/{problemIdx} with id: {sub["id"]}.')
+            if _contestTtl(contestStands) == sessionMan.IMMUTABLE:
+                sessionMan.remember(cacheKey, sub['id'], sessionMan.IMMUTABLE)
+            return sub['id']
+        if len(subs) < STATUS_PAGE_SIZE:
+            break
+        first += STATUS_PAGE_SIZE
     raise CriticalException(f"Can't find any C++ accepted submission for problem {problemIdx} in contest {contestId}")
 
 
+def _contestStandings(contestId: int) -> dict:
+    'Only the contest and problems are needed so a single row is requested, standings of finished contests are pinned in the cache.'
+    import sessionMan
+    path = f'/api/contest.standings?contestId={contestId}&from=1&count=1&showUnofficial=true'
+    stands = sessionMan.getApi(path, sessionMan.CACHE_TTL)
+    if _contestTtl(stands) == sessionMan.IMMUTABLE:
+        sessionMan.pin(f'GET {path}')
+    return stands
+
+
+def _fetchSubmissionSource(contestId: int, subId: int) -> dict:
+    'Returns the submission source and tests as sent by CF to its submission page, they never change so they are cached forever.'
+    import sessionMan
+    import bs4
+    cacheKey = f'submitSource {subId}'
+    res = sessionMan.cached(cacheKey)
+    if res != None:
+        return res.json()
+    bs = bs4.BeautifulSoup(sessionMan.get(f'/contest/{contestId}/submission/{subId}').text, 'lxml')
+
+    xcsrf = bs.select_one('meta[name="X-Csrf-Token"]').get('content')
+    return sessionMan.post('/data/submitSource',
+                           headers={
+                               'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
+                               'X-Csrf-Token': xcsrf
+                           },
+                           data=f'submissionId={subId}&csrf_token={xcsrf}', ttl=sessionMan.IMMUTABLE, cacheKey=cacheKey).json()
+
+
 class TestSet:
-    __slots__ = ('problemId', 'userId', 'contestId', 'problemIdx', 'tests')
+    """Only the tests ids and payload hashes are fetched, iterating the set yields its tests ordered by kind then number
+    and their payloads are loaded once accessed.
+    None tests ids means all of the tests of that kind and an empty list means none of them."""
+    __slots__ = ('problemId', 'userId', 'contestId', 'problemIdx', '_rows')
 
+    @tracer.traced('db')
     def __init__(self, pid: int, cfTestsIds: List[int] = None, uTestsIds: List[int] = None):
-        self.problemId, self.tests = pid, []
+        self.problemId = pid
         with getConnection() as con:
             # get members
             c = con.execute('SELECT * FROM Problem WHERE id = :pid', {'pid': pid})
@@ -142,19 +459,26 @@ class TestSet:
             self.userId, self.contestId, self.problemIdx = data[
                 'userId'], data['contestId'], data['problemIdx']
 
-            # get tests
-            cfTestsIdsCondition = "id LIKE 'CF%'" if cfTestsIds == None else '1 = 0'
-            if cfTestsIds != None and len(cfTestsIds) > 0:
-                cfTestsIdsCondition = 'id IN (' + ', '.join(f"'CF{i}'" for i in cfTestsIds) + ')'
-
-            uTestsIdsCondition = "id LIKE 'U%'" if uTestsIds == None else '1 = 0'
-            if uTestsIds != None and len(uTestsIds) > 0:
-                uTestsIdsCondition = 'id IN (' + ', '.join(f"'U{i}'" for i in uTestsIds) + ')'
-
-            testsQuery = f'SELECT * FROM Test WHERE problemId = :pid AND ({cfTestsIdsCondition} OR {uTestsIdsCondition})'
-            c = con.execute(testsQuery, {'pid': pid})
-            for r in c.fetchall():
-                self.tests.append(Test(r))
+            # get tests metadata
+            conditions, params = [], [pid]
+            for kind, ids in (('CF', cfTestsIds), ('U', uTestsIds)):
+                if ids == None:
+                    conditions.append('kind = ?')
+                    params.append(kind)
+                elif len(ids) > 0:
+                    conditions.append(f'(kind = ? AND number IN ({", ".join("?" * len(ids))}))')
+                    params.append(kind)
+                    params.extend(ids)
+            self._rows = []
+            if len(conditions) > 0:
+                self._rows = con.execute(f'SELECT problemId, id, inputHash, answerHash FROM Test WHERE problemId = ? AND ({" OR ".join(conditions)}) ORDER BY kind, number',
+                                         params).fetchall()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __iter__(self):
+        return (Test(r) for r in self._rows)
 
     @staticmethod
     def _parseAndStoreSubmissionTests(contestId: int, subId: int, problemId: int, trans: list = None, transSep: str = None) -> int:
@@ -162,60 +486,59 @@ class TestSet:
         trans will receive each test case input and output seperated by transSep and its supposed to print the same.
         Also, If input or ouput are empty then the case won't be saved.
         """
-        bs = bs4.BeautifulSoup(cfSession.get(f'https://codeforces.com/contest/{contestId}/submission/{subId}').text, 'lxml')
-
-        xcsrf = bs.select_one('meta[name="X-Csrf-Token"]').get('content')
-        d = cfSession.post('https://codeforces.com/data/submitSource',
-                           headers={
-                               'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-                               'X-Csrf-Token': xcsrf
-                           },
-                           data=f'submissionId={subId}&csrf_token={xcsrf}').json()
-        cnt = 0
-        with getConnection() as con:
-            for i in range(1, int(d['testCount']) + 1):
-                ipt, opt = d[f'input#{i}'].replace('\r\n', '\n').strip(), d[f'answer#{i}'].replace('\r\n', '\n').strip()
-                if trans != None:
-                    transInput = f'{ipt}\n{transSep}\n{opt}'
-                    try:
-                        ipt, opt = subprocess.run(trans, text=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=True, input=transInput).stdout.split(transSep)
-                    except subprocess.CalledProcessError as er:
-                        raise CriticalException('Case transformer exited with non-zero code.')
-                elif ipt.endswith('...') or opt.endswith('...'):
-                    ipt, opt = None, None
-                if ipt != None and (str.isspace(ipt) == False and len(ipt) > 0) and opt != None and (str.isspace(opt) == False and len(opt) > 0):
-                    cnt += 1
-                    con.execute('INSERT INTO Test(problemId, id, input, answer) VALUES(:problemId, :id, :input, :answer)',
-                                {'problemId': problemId, 'id': f'CF{i}', 'input': ipt, 'answer': opt})
-
-        return cnt
+        d = _fetchSubmissionSource(contestId, subId)
+        rows = []
+        for i in range(1, int(d['testCount']) + 1):
+            ipt, opt = d[f'input#{i}'].replace('\r\n', '\n').strip(), d[f'answer#{i}'].replace('\r\n', '\n').strip()
+            if trans != None:
+                transInput = f'{ipt}\n{transSep}\n{opt}'
+                try:
+                    ipt, opt = subprocess.run(trans, text=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=True, input=transInput).stdout.split(transSep)
+                except subprocess.CalledProcessError as er:
+                    raise CriticalException('Case transformer exited with non-zero code.')
+            elif ipt.endswith('...') or opt.endswith('...'):
+                ipt, opt = None, None
+            if ipt != None and (str.isspace(ipt) == False and len(ipt) > 0) and opt != None and (str.isspace(opt) == False and len(opt) > 0):
+                rows.append((i, ipt, opt))
+        with writeTransaction() as con:
+            con.executemany("INSERT INTO Test(problemId, id, kind, number, inputHash, answerHash) VALUES(:problemId, :id, 'CF', :number, :input, :answer)",
+                            ({'problemId': problemId, 'id': f'CF{i}', 'number': i, 'input': _storePayload(con, ipt), 'answer': _storePayload(con, opt)}
+                             for i, ipt, opt in rows))
+            _pruneOrphanPayloads(con)
+
+        return len(rows)
 
     @staticmethod
     def _parseAndStoreProblemSamples(contestId: int, probIdx: int, problemId: int) -> int:
-        bs = bs4.BeautifulSoup(cfSession.get(f'https://codeforces.com/contest/{contestId}/problem/{probIdx}').text, 'lxml')
+        import sessionMan
+        import bs4
+        bs = bs4.BeautifulSoup(sessionMan.get(f'/contest/{contestId}/problem/{probIdx}', ttl=sessionMan.CACHE_TTL).text, 'lxml')
 
         samplesDiv: bs4.Tag = bs.select_one('div.sample-tests')
         inputs = samplesDiv.select('div.input>pre')
         outputs = samplesDiv.select('div.output>pre')
-        with getConnection() as con:
-            for i in range(len(inputs)):
-                con.execute('INSERT INTO Test(problemId, id, input, answer) VALUES(:problemId, :id, :input, :answer)',
-                            {'problemId': problemId, 'id': f'CF{i+1}', 'input': inputs[i].text, 'answer': outputs[i].text})
+        with writeTransaction() as con:
+            con.executemany("INSERT INTO Test(problemId, id, kind, number, inputHash, answerHash) VALUES(:problemId, :id, 'CF', :number, :input, :answer)",
+                            ({'problemId': problemId, 'id': f'CF{i+1}', 'number': i + 1, 'input': _storePayload(con, inputs[i].text), 'answer': _storePayload(con, outputs[i].text)}
+                             for i in range(len(inputs))))
+            _pruneOrphanPayloads(con)
         return len(inputs)
 
     @staticmethod
-    def cfLoadTestSet(userId: str, transformerPath: str = None) -> int:
+    @tracer.traced('db')
+    def cfLoadTestSet(userId: str, transformerPath: str = None, stands: dict = None) -> int:
+        'stands is the contest standings if they are already fetched.'
         with getConnection() as con:
             r = con.execute('SELECT id, contestId, problemIdx FROM Problem WHERE userId = :userId', {'userId': userId}).fetchone()
             pid, contestId, problemIdx = None, None, None
             if r != None:
                 pid, contestId, problemIdx = r[0], r[1], r[2]
-                con.execute("DELETE FROM Test WHERE problemId = :pid AND id LIKE 'CF%'", {'pid': pid})
+                con.execute("DELETE FROM Test WHERE problemId = :pid AND kind = 'CF'", {'pid': pid})
                 con.commit()
             else:
                 raise CriticalException(f'There is no problem with id: {userId} in db.')
-            stands = cfSession.get(
-                f'https://codeforces.com/api/contest.standings?contestId={contestId}&from=1&count=10&showUnofficial=true').json()['result']
+            if stands == None:
+                stands = _contestStandings(contestId)
             loadSamples = stands['contest']['phase'].lower() != 'finished'
             if loadSamples == False:
                 acc = _findAcceptedSub(contestId, problemIdx, stands)
@@ -237,22 +560,173 @@ class TestSet:
                 return TestSet._parseAndStoreProblemSamples(contestId, problemIdx, pid)
 
     @staticmethod
+    def cfLoadContestTestSets(contestId: int, transformerPath: str = None, jobs: int = None) -> Dict[str, int]:
+        """Loads the test sets of all of the contest problems in db concurrently using a single standings fetch,
+        returns the number of loaded tests for each problem user id, problems that failed to load are logged and left out."""
+        probs = Problem.getByContestId(contestId)
+        if len(probs) == 0:
+            return {}
+        import sessionMan
+        stands = _contestStandings(contestId)
+        res = {}
+        with ThreadPoolExecutor(max_workers=jobs if jobs != None and jobs > 0 else sessionMan.MAX_WORKERS) as ex:
+            futures = {ex.submit(TestSet.cfLoadTestSet, p.userId, transformerPath, stands): p for p in probs}
+            for f in as_completed(futures):
+                p = futures[f]
+                try:
+                    res[p.userId] = f.result()
+                except CriticalException as er:
+                    logging.error(f"Couldn't load problem {p.userId} tests: {er}")
+        return res
+
+    @staticmethod
+    @tracer.traced('db')
     def loadTestSet(userId: str, tests: List[Tuple[str, str]]) -> Tuple[str, str]:
         'tests : [(ipt, opt)]'
-        with getConnection() as con:
+        with writeTransaction() as con:
             r = con.execute('SELECT id FROM Problem WHERE userId = :userId', {'userId': userId}).fetchone()
             if r == None:
                 raise CriticalException(f'There is no problem with id: {userId} in db.')
             pid = r[0]
-            r = con.execute("SELECT max(CAST(SUBSTR(id, 2) AS INTEGER)) FROM Test WHERE problemId = :pid AND id LIKE 'U%'",
-                            {'pid': pid}).fetchone()
-            i = 1 if r == None else (r[0] + 1)
-            i0 = i
-            for t in tests:
-                con.execute('INSERT INTO TEST(problemId, id, input, answer) VALUES(:pid, :id, :ipt, :ans)',
-                            {'pid': pid, 'id': f'U{i}', 'ipt': t[0], 'ans': t[1]})
-                i += 1
-            return (f'U{i0}', f'U{i - 1}')
+            r = con.execute("SELECT max(number) FROM Test WHERE problemId = :pid AND kind = 'U'", {'pid': pid}).fetchone()
+            i0 = 1 if r[0] == None else (r[0] + 1)
+            con.executemany("INSERT INTO TEST(problemId, id, kind, number, inputHash, answerHash) VALUES(:pid, :id, 'U', :number, :ipt, :ans)",
+                            ({'pid': pid, 'id': f'U{i0 + j}', 'number': i0 + j, 'ipt': _storePayload(con, t[0]), 'ans': _storePayload(con, t[1])}
+                             for j, t in enumerate(tests)))
+            return (f'U{i0}', f'U{i0 + len(tests) - 1}')
+
+
+class RunResult:
+    'cpuTime is in ms, memory is in KB and timestamp is in ms since the epoch.'
+    __slots__ = ('problemId', 'testId', 'sourceHash', 'timestamp', 'cpuTime', 'memory')
+
+    def __init__(self, r: sqlite3.Row):
+        self.problemId, self.testId, self.sourceHash, self.timestamp = r['problemId'], r['testId'], r['sourceHash'], r['timestamp']
+        self.cpuTime, self.memory = r['cpuTime'], r['memory']
+
+    @staticmethod
+    @tracer.traced('db')
+    def record(problemId: int, sourceHash: str, results: List[Tuple[str, float, int]]) -> int:
+        'results : [(testId, cpuTime, memory)], returns the timestamp they were recorded with.'
+        timestamp = int(datetime.now().timestamp() * 1000)
+        with getConnection() as con:
+            con.executemany('INSERT INTO RunResult(problemId, testId, sourceHash, timestamp, cpuTime, memory) VALUES(?, ?, ?, ?, ?, ?)',
+                            ((problemId, testId, sourceHash, timestamp, cpuTime, memory) for testId, cpuTime, memory in results))
+        return timestamp
+
+    @staticmethod
+    def _perTest(problemId: int, sourceCondition: str, sourceHash: str, order: str) -> Dict[str, 'RunResult']:
+        'Picks the first result of every test ordered by order among the results matching sourceCondition.'
+        with getConnection() as con:
+            rows = con.execute(f"""SELECT * FROM (SELECT *, row_number() OVER (PARTITION BY testId ORDER BY {order}) AS rank
+                                  FROM RunResult WHERE problemId = ? AND {sourceCondition}) WHERE rank = 1""", (problemId, sourceHash)).fetchall()
+        return {r['testId']: RunResult(r) for r in rows}
+
+    @staticmethod
+    @tracer.traced('db')
+    def latest(problemId: int, sourceHash: str) -> Dict[str, 'RunResult']:
+        'Latest result of every test run using this source.'
+        return RunResult._perTest(problemId, 'sourceHash = ?', sourceHash, 'timestamp DESC')
+
+    @staticmethod
+    @tracer.traced('db')
+    def previous(problemId: int, sourceHash: str) -> Dict[str, 'RunResult']:
+        'Latest result of every test run using any other source.'
+        return RunResult._perTest(problemId, 'sourceHash != ?', sourceHash, 'timestamp DESC')
+
+    @staticmethod
+    @tracer.traced('db')
+    def best(problemId: int, sourceHash: str) -> Dict[str, 'RunResult']:
+        'Fastest result of every test run using any other source.'
+        return RunResult._perTest(problemId, 'sourceHash != ?', sourceHash, 'cpuTime, timestamp DESC')
+
+
+class TestHistory:
+    'failRate is between 0 and 1 and cpuTime is in ms, both weigh each run as much as all of the runs before it.'
+    __slots__ = ('testId', 'runs', 'failRate', 'cpuTime')
+    # weight of the latest run in the moving averages
+    WEIGHT = 0.5
+
+    def __init__(self, r: sqlite3.Row):
+        self.testId, self.runs, self.failRate, self.cpuTime = r['testId'], r['runs'], r['failRate'], r['cpuTime']
+
+    @staticmethod
+    @tracer.traced('db')
+    def record(problemId: int, results: List[Tuple[str, bool, float]]):
+        'results : [(testId, passed, cpuTime)]'
+        with writeTransaction() as con:
+            con.executemany(f"""INSERT INTO TestHistory(problemId, testId, runs, failRate, cpuTime) VALUES(?, ?, 1, ?, ?)
+                               ON CONFLICT(problemId, testId) DO UPDATE SET runs = runs + 1,
+                               failRate = failRate * (1 - {TestHistory.WEIGHT}) + excluded.failRate * {TestHistory.WEIGHT},
+                               cpuTime = cpuTime * (1 - {TestHistory.WEIGHT}) + excluded.cpuTime * {TestHistory.WEIGHT}""",
+                            ((problemId, testId, 0.0 if passed else 1.0, cpuTime) for testId, passed, cpuTime in results))
+
+    @staticmethod
+    @tracer.traced('db')
+    def get(problemId: int) -> Dict[str, 'TestHistory']:
+        with getConnection() as con:
+            return {r['testId']: TestHistory(r) for r in con.execute('SELECT * FROM TestHistory WHERE problemId = ?', (problemId,))}
+
+
+class Corpus:
+    """Generated stress cases of a problem along with the answer of the reference solver that solverKey identifies, see compiler.executableKey.
+    Once a problem has more than CORPUS_SIZE cases the least recently used ones are evicted."""
+    __slots__ = ('inputHash', 'answerHash', 'dataHash')
+    CORPUS_SIZE = int(os.environ.get('CFTESTER_CORPUS_SIZE', 2000))
+
+    def __init__(self, r: sqlite3.Row):
+        self.inputHash, self.answerHash, self.dataHash = r['inputHash'], r['answerHash'], r['dataHash']
+
+    @property
+    def input(self):
+        return loadPayload(self.inputHash)
+
+    @property
+    def answer(self):
+        return loadPayload(self.answerHash)
+
+    @property
+    def additionalData(self):
+        return loadPayload(self.dataHash)
+
+    @staticmethod
+    @tracer.traced('db')
+    def cases(problemId: int, solverKey: str) -> List['Corpus']:
+        'Most recently used first.'
+        with getConnection() as con:
+            return [Corpus(r) for r in con.execute('SELECT * FROM Corpus WHERE problemId = ? AND solverKey = ? ORDER BY lastUsed DESC', (problemId, solverKey))]
+
+    @staticmethod
+    @tracer.traced('db')
+    def answerOf(problemId: int, solverKey: str, input: str) -> str:
+        'Returns the stored answer to input, or None if its not in the corpus.'
+        with getConnection() as con:
+            r = con.execute('SELECT answerHash FROM Corpus WHERE problemId = ? AND solverKey = ? AND inputHash = ?',
+                            (problemId, solverKey, payloadHash(input))).fetchone()
+        return None if r == None else loadPayload(r[0])
+
+    @staticmethod
+    @tracer.traced('db')
+    def add(problemId: int, solverKey: str, cases: List[Tuple[str, str, str]]):
+        'cases : [(input, answer, additionalData)], cases already in the corpus are only marked as used.'
+        now = time.time_ns()
+        with writeTransaction() as con:
+            con.executemany("""INSERT INTO Corpus(problemId, solverKey, inputHash, answerHash, dataHash, lastUsed) VALUES(?, ?, ?, ?, ?, ?)
+                               ON CONFLICT(problemId, solverKey, inputHash) DO UPDATE SET lastUsed = excluded.lastUsed""",
+                            ((problemId, solverKey, _storePayload(con, i), _storePayload(con, a), _storePayload(con, d), now) for i, a, d in cases))
+            evicted = con.execute('DELETE FROM Corpus WHERE rowid IN (SELECT rowid FROM Corpus WHERE problemId = ? ORDER BY lastUsed DESC LIMIT -1 OFFSET ?)',
+                                  (problemId, Corpus.CORPUS_SIZE)).rowcount
+            if evicted > 0:
+                _pruneOrphanPayloads(con)
+
+    @staticmethod
+    @tracer.traced('db')
+    def touch(problemId: int, solverKey: str, inputHashes: List[bytes]):
+        'Marks the cases as used so they are evicted last.'
+        now = time.time_ns()
+        with writeTransaction() as con:
+            con.executemany('UPDATE Corpus SET lastUsed = ? WHERE problemId = ? AND solverKey = ? AND inputHash = ?',
+                            ((now, problemId, solverKey, h) for h in inputHashes))
 
 
 class ProblemSln:
@@ -265,20 +739,13 @@ class ProblemSln:
 
     @staticmethod
     def _parseAndstoreSubmissionSln(contestId: int, subId: int, problemId: int) -> None:
-        bs = bs4.BeautifulSoup(cfSession.get(f'https://codeforces.com/contest/{contestId}/submission/{subId}').text, 'lxml')
-
-        xcsrf = bs.select_one('meta[name="X-Csrf-Token"]').get('content')
-        d = cfSession.post('https://codeforces.com/data/submitSource',
-                           headers={
-                               'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8',
-                               'X-Csrf-Token': xcsrf
-                           },
-                           data=f'submissionId={subId}&csrf_token={xcsrf}').json()
+        d = _fetchSubmissionSource(contestId, subId)
         with getConnection() as con:
             con.execute('INSERT INTO ProblemSln(problemId, source) VALUES(:pid, :src)', {
                         'pid': problemId, 'src': d['source'].replace('\r\n', '\n')})
 
     @staticmethod
+    @tracer.traced('db')
     def cfLoadProblemSln(userId: str):
         with getConnection() as con:
             r = con.execute('SELECT id, contestId, problemIdx FROM Problem WHERE userId = :userId',
@@ -290,8 +757,7 @@ class ProblemSln:
                     return ProblemSln(pid)
             else:
                 raise CriticalException(f'There is no problem with Id = {userId}')
-            stands = cfSession.get(
-                f'https://codeforces.com/api/contest.standings?contestId={contestId}&from=1&count=10&showUnofficial=true').json()['result']
+            stands = _contestStandings(contestId)
             if stands['contest']['phase'].lower() != 'finished':
                 raise CriticalException(f'The contest is not finished yet, so can\'t download any solutions yet')
             ProblemSln._parseAndstoreSubmissionSln(
@@ -301,7 +767,10 @@ class ProblemSln:
 
 def cmd(args: argparse.Namespace) -> bool:
     if args.subparserName == 'addProblem':
-        Problem.addProblem(args.problemid, None, None)
+        Problem.addProblem(args.problemId, None, None, args.timeLimit, args.memoryLimit)
+        return True
+    if args.subparserName == 'setLimits':
+        Problem.setLimits(args.problemId, args.timeLimit, args.memoryLimit)
         return True
     if args.subparserName == 'cfAddProblem':
         try:
@@ -309,11 +778,11 @@ def cmd(args: argparse.Namespace) -> bool:
             contestId = int(url[url.index('contest') + 1])
             problemIdx = None if url.count('problem') == 0 else url[url.index('problem') + 1]
             if problemIdx == None:
-                probs = Problem.cfAddContest(contestId, args.contestId)
-                print(f'Added {len(probs)} with ids: {", ".join(p.id for p in probs)}')
+                probs = Problem.cfAddContest(contestId, args.contestId, args.timeLimit, args.memoryLimit)
+                print(f'Added {len(probs)} with ids: {", ".join(p.userId for p in probs)}')
             else:
                 uid = args.problemId if args.problemId else f'{contestId}{problemIdx}'
-                Problem.addProblem(uid, contestId, problemIdx)
+                Problem.addProblem(uid, contestId, problemIdx, args.timeLimit, args.memoryLimit)
                 print(f'Added 1 problem with id = {uid}')
             return True
         except ValueError:
@@ -322,10 +791,9 @@ def cmd(args: argparse.Namespace) -> bool:
         if args.problemId:
             print(f'Loaded {TestSet.cfLoadTestSet(args.problemId, args.transformer)} tests')
         else:
-            probs = Problem.getByContestId(int(args.contestId))
-            for p in probs:
-                print(f'Loading problem {p.id} tests')
-                print(f'Loaded {TestSet.cfLoadTestSet(p.id)} tests')
+            loaded = TestSet.cfLoadContestTestSets(int(args.contestId), args.transformer, args.jobs)
+            for uid in sorted(loaded.keys()):
+                print(f'Loaded {loaded[uid]} tests for problem {uid}')
         return True
     if args.subparserName == 'loadTestset':
         with open(args.setPath, 'r') as st:
@@ -345,9 +813,15 @@ def cmd(args: argparse.Namespace) -> bool:
     return False
 
 
+def addLimitsArguments(p: argparse.ArgumentParser):
+    p.add_argument('--timeLimit', type=int, help='Time limit in ms of CPU time.')
+    p.add_argument('--memoryLimit', type=int, help='Memory limit in MB.')
+
+
 def addParser(p: argparse._SubParsersAction):
     pAddProblem = p.add_parser('addProblem', description='Adds a on-cf problem to the db.')
     pAddProblem.add_argument('problemId', help='Id of the new problem to add.')
+    addLimitsArguments(pAddProblem)
 
     pCFAddProblem = p.add_parser('cfAddProblem',
                                  description='Adds a cf problem or contest to the db, but doesn\'t download the cases or anything.')
@@ -358,6 +832,11 @@ def addParser(p: argparse._SubParsersAction):
                                        help='In case the its a contest url this argument will prefix all of the contest problems ids, by default it will be the contest id.')
     pCFAddProblemIdsGroup.add_argument('--problemId',
                                        help='In case the its a problem url this argument will be the id of the new problem, by default its ContestId+ProblemIdx.')
+    addLimitsArguments(pCFAddProblem)
+
+    pSetLimits = p.add_parser('setLimits', description='Sets the default time and memory limits of a problem.')
+    pSetLimits.add_argument('problemId', help='Id of the problem to update.')
+    addLimitsArguments(pSetLimits)
 
     pCFLoadTestSet = p.add_parser('cfLoadTestset',
                                   description='Loads a CF problem or contest test set from CF and stores it in db.')
@@ -368,6 +847,8 @@ def addParser(p: argparse._SubParsersAction):
     pCFLoadTestSetIdsGroup.add_argument('--problemId', help='Id of the problem to load its test set.')
     pCFLoadTestSet.add_argument('--transformer',
                                 help='A program that will be apply a transformation on each test case for instance to salvage what you can from multiple case test cases, it will receive each test case input and output seperated by --seperator and its supposed to print the same. In case nothing can be salvaged just print empty lines.')
+    pCFLoadTestSet.add_argument('--jobs', type=int,
+                                help='Number of problems to load at the same time when loading a contest, by default its the number of concurrent CF requests allowed.')
 
     pLoadTest = p.add_parser('loadTestset', description='loads a non-CF problem test set from a file and stores it in db.')
     pLoadTest.add_argument('problemId', help='Id of the problem to load its test sets.')
@@ -0,0 +1,113 @@
+import os
+import time
+import select
+import struct
+import logging
+from typing import List, Set
+
+# Saves are detected with inotify on the directories of the watched files since editors often save by replacing the file,
+# where inotify isn't available the files modification times are polled instead.
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+# seconds between polls when inotify isn't available
+POLL_INTERVAL = 0.25
+# seconds to keep collecting changes after the first one so a save that touches the file many times is reported once
+DEBOUNCE = 0.05
+_eventHeader = struct.Struct('iIII')
+
+
+class FileWatcher:
+    'Reports which of the watched files were saved.'
+
+    def __init__(self, paths: List[str]):
+        self.paths = {os.path.abspath(p) for p in paths}
+        self._fd, self._dirs = None, {}
+        try:
+            self._watchDirectories()
+        except (OSError, AttributeError) as er:
+            self.close()
+            logging.info(f"Couldn't use inotify ({er}), polling for changes instead.")
+        self._stats = {p: self._stat(p) for p in self.paths}
+
+    def _watchDirectories(self):
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        self._fd = libc.inotify_init1(os.O_CLOEXEC | os.O_NONBLOCK)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()))
+        for d in {os.path.dirname(p) for p in self.paths}:
+            wd = libc.inotify_add_watch(self._fd, os.fsencode(d), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), os.strerror(ctypes.get_errno()), d)
+            self._dirs[wd] = d
+
+    @staticmethod
+    def _stat(path: str):
+        try:
+            st = os.stat(path)
+            return st.st_mtime_ns, st.st_size, st.st_ino
+        except OSError:
+            return None
+
+    def _readEvents(self) -> Set[str]:
+        res = set()
+        while True:
+            try:
+                buf = os.read(self._fd, 1 << 16)
+            except BlockingIOError:
+                return res
+            offset = 0
+            while offset < len(buf):
+                wd, _, _, length = _eventHeader.unpack_from(buf, offset)
+                name = buf[offset + _eventHeader.size:offset + _eventHeader.size + length].rstrip(b'\0')
+                offset += _eventHeader.size + length
+                path = os.path.join(self._dirs.get(wd, ''), os.fsdecode(name))
+                if path in self.paths:
+                    res.add(path)
+
+    def _poll(self) -> Set[str]:
+        res = set()
+        for p in self.paths:
+            st = self._stat(p)
+            if st != self._stats[p]:
+                self._stats[p] = st
+                res.add(p)
+        return res
+
+    def _changes(self, timeout: float) -> Set[str]:
+        if self._fd != None:
+            if len(select.select([self._fd], [], [], timeout)[0]) == 0:
+                return set()
+            return self._readEvents()
+        deadline = None if timeout == None else time.monotonic() + timeout
+        while True:
+            res = self._poll()
+            if len(res) > 0 or (deadline != None and time.monotonic() >= deadline):
+                return res
+            time.sleep(POLL_INTERVAL if deadline == None else max(0, min(POLL_INTERVAL, deadline - time.monotonic())))
+
+    def wait(self, timeout: float = None) -> Set[str]:
+        'Blocks until some of the files are saved and returns their paths, or returns an empty set once timeout seconds pass.'
+        deadline = None if timeout == None else time.monotonic() + timeout
+        while True:
+            res = self._changes(None if deadline == None else max(0, deadline - time.monotonic()))
+            if len(res) > 0:
+                while True:
+                    more = self._changes(DEBOUNCE)
+                    if len(more) == 0:
+                        return res
+                    res |= more
+            if deadline != None and time.monotonic() >= deadline:
+                return res
+
+    def close(self):
+        if self._fd != None:
+            os.close(self._fd)
+            self._fd = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,114 @@
+// Runs a python script through its fork server, used by forkserver.py.
+// The client hands its stdin, stdout and stderr to the server along with its cwd, cpu affinity, cpu time limit, args and environment,
+// the server forks a child that runs the script using them and replies with "<wait status> <user time us> <system time us> <peak rss KB>" once it exits.
+// The client then exits the same way the child did, and if CFTESTER_USAGE_FD is set it writes the child usage to it for runguard.
+// usage: forkclient <socket> <script> [args...]
+#include <cerrno>
+#include <csignal>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <cstdint>
+#include <string>
+#include <sched.h>
+#include <unistd.h>
+#include <sys/resource.h>
+#include <sys/socket.h>
+#include <sys/un.h>
+#include <sys/wait.h>
+
+extern char **environ;
+
+static bool sendAll(int fd, const char *data, size_t size)
+{
+    while (size > 0)
+    {
+        ssize_t n = send(fd, data, size, MSG_NOSIGNAL);
+        if (n < 0 && errno == EINTR)
+            continue;
+        if (n <= 0)
+            return false;
+        data += n, size -= n;
+    }
+    return true;
+}
+
+int main(int argc, char **argv)
+{
+    if (argc < 3)
+    {
+        fprintf(stderr, "usage: forkclient <socket> <script> [args...]\n");
+        return 127;
+    }
+    int s = socket(AF_UNIX, SOCK_STREAM, 0);
+    sockaddr_un addr{};
+    addr.sun_family = AF_UNIX;
+    strncpy(addr.sun_path, argv[1], sizeof(addr.sun_path) - 1);
+    if (s < 0 || connect(s, (sockaddr *)&addr, sizeof(addr)) < 0)
+    {
+        perror("forkclient: can't connect to the fork server");
+        return 127;
+    }
+
+    std::string payload;
+    char cwd[4096];
+    payload.append(getcwd(cwd, sizeof(cwd)) ? cwd : ".").push_back('\0');
+    cpu_set_t set;
+    std::string cpus;
+    if (sched_getaffinity(0, sizeof(set), &set) == 0)
+        for (int i = 0; i < CPU_SETSIZE; i++)
+            if (CPU_ISSET(i, &set))
+                cpus += (cpus.empty() ? "" : ",") + std::to_string(i);
+    payload.append(cpus).push_back('\0');
+    rlimit lim{};
+    getrlimit(RLIMIT_CPU, &lim);
+    payload.append(lim.rlim_cur == RLIM_INFINITY ? "-1" : std::to_string(lim.rlim_cur)).push_back('\0');
+    payload.append(std::to_string(argc - 2)).push_back('\0');
+    for (int i = 2; i < argc; i++)
+        payload.append(argv[i]).push_back('\0');
+    for (char **e = environ; *e; e++)
+        payload.append(*e).push_back('\0');
+
+    // the payload size is sent along with the standard streams, then the payload follows
+    uint32_t size = payload.size();
+    int fds[3] = {0, 1, 2};
+    char control[CMSG_SPACE(sizeof(fds))]{};
+    iovec iov{&size, sizeof(size)};
+    msghdr msg{};
+    msg.msg_iov = &iov, msg.msg_iovlen = 1, msg.msg_control = control, msg.msg_controllen = sizeof(control);
+    cmsghdr *cmsg = CMSG_FIRSTHDR(&msg);
+    cmsg->cmsg_level = SOL_SOCKET, cmsg->cmsg_type = SCM_RIGHTS, cmsg->cmsg_len = CMSG_LEN(sizeof(fds));
+    memcpy(CMSG_DATA(cmsg), fds, sizeof(fds));
+    if (sendmsg(s, &msg, MSG_NOSIGNAL) != sizeof(size) || sendAll(s, payload.data(), payload.size()) == false)
+    {
+        perror("forkclient: can't send the request");
+        return 127;
+    }
+
+    std::string reply;
+    char buf[256];
+    ssize_t n;
+    while ((n = read(s, buf, sizeof(buf))) != 0)
+    {
+        if (n < 0 && errno == EINTR)
+            continue;
+        if (n < 0)
+            break;
+        reply.append(buf, n);
+    }
+    int status;
+    long userTime, sysTime, maxRss;
+    if (sscanf(reply.c_str(), "%d %ld %ld %ld", &status, &userTime, &sysTime, &maxRss) != 4)
+    {
+        fprintf(stderr, "forkclient: the fork server didn't reply\n");
+        return 127;
+    }
+    if (const char *usageFd = getenv("CFTESTER_USAGE_FD"))
+        dprintf(atoi(usageFd), "%ld %ld %ld\n", userTime, sysTime, maxRss);
+    if (WIFSIGNALED(status))
+    {
+        signal(WTERMSIG(status), SIG_DFL);
+        raise(WTERMSIG(status));
+    }
+    return WIFEXITED(status) ? WEXITSTATUS(status) : 127;
+}
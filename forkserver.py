@@ -0,0 +1,254 @@
+import os
+import sys
+import ast
+import signal
+import socket
+import selectors
+import runpy
+import traceback
+import threading
+import tempfile
+import shutil
+import subprocess
+import atexit
+import logging
+from typing import List
+
+# A fork server keeps an interpreter with a python script imports already loaded and forks a fresh child for every run of the script,
+# so runs skip the interpreter startup and the imports while staying isolated from each other.
+# Runs go through forkclient which hands its standard streams to the server and exits like the child did, see forkclient.cpp for the protocol.
+# Random state created while importing the preloaded modules is shared by every child, random and numpy.random are reseeded in the child
+# but other generators created at import time by the modules a script imports are not, run such scripts with CFTESTER_FORK_SERVER=0.
+# Set CFTESTER_FORK_SERVER=0 to run scripts using a fresh interpreter every time.
+clientSource = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'forkclient.cpp')
+_client: List[str] = None
+_servers = {}
+_lock = threading.Lock()
+
+
+def _enabled() -> bool:
+    return os.environ.get('CFTESTER_FORK_SERVER', '1') != '0' and hasattr(os, 'fork') and hasattr(socket, 'AF_UNIX')
+
+
+def _getClient() -> List[str]:
+    "Compiles forkclient once, returns None if it can't be compiled."
+    global _client
+    with _lock:
+        if _client == None:
+            import compiler
+            try:
+                _client = compiler.compile(clientSource)
+            except Exception:
+                logging.warning("Couldn't compile the fork server client, python scripts will start a new interpreter for every run.")
+                _client = []
+        return _client if len(_client) > 0 else None
+
+
+def _startServer(script: str) -> str:
+    'Starts the fork server of script and returns its socket path, or None if it failed to start.'
+    directory = tempfile.mkdtemp(prefix='cftester')
+    socketPath = os.path.join(directory, 'server.sock')
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), socketPath, script], stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                            start_new_session=True)
+    ready = proc.stdout.readline()
+    proc.stdout.close()
+
+    def stop():
+        if proc.poll() == None:
+            proc.terminate()
+            proc.wait()
+        shutil.rmtree(directory, ignore_errors=True)
+    atexit.register(stop)
+    if ready.strip() != b'ready':
+        logging.warning(f"Fork server of {script} didn't start, it will start a new interpreter for every run.")
+        return None
+    return socketPath
+
+
+def command(script: str) -> List[str]:
+    'Returns the args that run script through its fork server, which is started on first use, or using the current interpreter if fork servers are unavailable.'
+    client = _getClient() if _enabled() else None
+    if client != None:
+        with _lock:
+            if script not in _servers:
+                _servers[script] = _startServer(script)
+            socketPath = _servers[script]
+        if socketPath != None:
+            return client + [socketPath, script]
+    return [sys.executable, script]
+
+
+def _preload(script: str):
+    'Imports every module the script imports, failures are ignored since the script may guard or never reach them.'
+    try:
+        with open(script, 'r') as f:
+            tree = ast.parse(f.read(), script)
+    except (OSError, SyntaxError, ValueError):
+        return
+    for node in ast.walk(tree):
+        names = []
+        if isinstance(node, ast.Import):
+            names = [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module != None:
+            names = [node.module]
+        for name in names:
+            try:
+                __import__(name)
+            except BaseException:
+                pass
+
+
+def _receive(conn: socket.socket):
+    'Returns the client fds, cwd, cpus, cpu limit, args and environment.'
+    header, fds, _, _ = socket.recv_fds(conn, 4, 3)
+    if len(header) != 4 or len(fds) != 3:
+        raise ValueError('Malformed request.')
+    size = int.from_bytes(header, sys.byteorder)
+    payload = bytearray()
+    while len(payload) < size:
+        chunk = conn.recv(size - len(payload))
+        if not chunk:
+            raise ValueError('Request was cut short.')
+        payload += chunk
+    fields = [f.decode('utf8', errors='surrogateescape') for f in payload.split(b'\0')[:-1]]
+    argsCount = int(fields[3])
+    cpus = [int(c) for c in fields[1].split(',') if c != '']
+    env = dict(e.split('=', 1) for e in fields[4 + argsCount:] if '=' in e)
+    return fds, fields[0], cpus, int(fields[2]), fields[4:4 + argsCount], env
+
+
+def _runChild(script: str, closeFds: list, fds: list, cwd: str, cpus: list, cpuLimit: int, args: list, env: dict):
+    'Runs in the forked child, never returns.'
+    code = 1
+    try:
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        for s in closeFds:
+            s.close()
+        for i, fd in enumerate(fds):
+            os.dup2(fd, i)
+        for fd in fds:
+            if fd > 2:
+                os.close(fd)
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(env)
+        if len(cpus) > 0 and hasattr(os, 'sched_setaffinity'):
+            os.sched_setaffinity(0, cpus)
+        if cpuLimit >= 0:
+            import resource
+            resource.setrlimit(resource.RLIMIT_CPU, (cpuLimit, cpuLimit + 1))
+        sys.stdin, sys.stdout, sys.stderr = open(0, 'r', closefd=False), open(1, 'w', closefd=False), open(2, 'w', closefd=False)
+        sys.argv = args
+        # random reseeds itself after a fork but the global numpy generator keeps the state it got while preloading,
+        # so without this every run of an unseeded generator would print the same case
+        numpyRandom = sys.modules.get('numpy.random')
+        if numpyRandom != None:
+            numpyRandom.seed()
+        code = 0
+        try:
+            runpy.run_path(script, run_name='__main__')
+        except SystemExit as er:
+            if er.code == None or isinstance(er.code, int):
+                code = 0 if er.code == None else er.code
+            else:
+                print(er.code, file=sys.stderr)
+                code = 1
+        except BaseException as er:
+            # the frames of the server and runpy are left out like a plain interpreter would
+            tb = er.__traceback__
+            while tb != None and tb.tb_frame.f_code.co_filename != script:
+                tb = tb.tb_next
+            traceback.print_exception(type(er), er, er.__traceback__ if tb == None else tb)
+            code = 1
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except (BrokenPipeError, OSError, ValueError):
+                pass
+    finally:
+        os._exit(code)
+
+
+def serve(socketPath: str, script: str):
+    """Preloads the script imports then forks a child for every client request.
+    Its single threaded so forking is safe, a child is killed if its client disconnects before it exits, which happens when the client is killed.
+    The server exits once the process that started it exits."""
+    script = os.path.abspath(script)
+    sys.path.insert(0, os.path.dirname(script))
+    _preload(script)
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socketPath)
+    listener.listen(128)
+    wakeRead, wakeWrite = socket.socketpair()
+    wakeRead.setblocking(False)
+    wakeWrite.setblocking(False)
+    signal.set_wakeup_fd(wakeWrite.fileno())
+    signal.signal(signal.SIGCHLD, lambda *_: None)
+    sel = selectors.DefaultSelector()
+    sel.register(listener, selectors.EVENT_READ, None)
+    sel.register(wakeRead, selectors.EVENT_READ, 0)
+    children = {}
+    parent = os.getppid()
+    print('ready', flush=True)
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+
+    while os.getppid() == parent:
+        for key, _ in sel.select(timeout=1):
+            if key.data == None:
+                conn, _ = listener.accept()
+                try:
+                    fds, cwd, cpus, cpuLimit, args, env = _receive(conn)
+                except (OSError, ValueError):
+                    conn.close()
+                    continue
+                pid = os.fork()
+                if pid == 0:
+                    _runChild(script, [listener, wakeRead, wakeWrite, conn] + [c for c in children.values()], fds, cwd, cpus, cpuLimit, args, env)
+                for fd in fds:
+                    os.close(fd)
+                children[pid] = conn
+                sel.register(conn, selectors.EVENT_READ, pid)
+            elif key.data == 0:
+                try:
+                    while wakeRead.recv(4096):
+                        pass
+                except BlockingIOError:
+                    pass
+                while len(children) > 0:
+                    try:
+                        pid, status, usage = os.wait4(-1, os.WNOHANG)
+                    except ChildProcessError:
+                        break
+                    if pid == 0:
+                        break
+                    conn = children.pop(pid, None)
+                    if conn == None:
+                        continue
+                    try:
+                        sel.unregister(conn)
+                    except KeyError:
+                        pass
+                    try:
+                        conn.sendall(f'{status} {int(usage.ru_utime * 1000000)} {int(usage.ru_stime * 1000000)} {usage.ru_maxrss}\n'.encode('utf8'))
+                    except OSError:
+                        pass
+                    conn.close()
+            else:
+                # the client never sends anything after its request so this is a disconnect
+                sel.unregister(key.fileobj)
+                try:
+                    os.kill(key.data, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+    for pid in children.keys():
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+if __name__ == '__main__':
+    serve(sys.argv[1], sys.argv[2])
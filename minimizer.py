@@ -0,0 +1,97 @@
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List
+import logging
+
+# Delta debugging (ddmin) of failing inputs, first over lines then over the whitespace separated tokens of the remaining lines.
+# Every round evaluates its candidate reductions concurrently and results are memoized by the candidate text.
+
+
+def _splitLines(input: str) -> List[str]:
+    return [l for l in input.split('\n') if len(l.strip()) > 0]
+
+
+def _joinLines(lines: List[str]) -> str:
+    return '\n'.join(lines) + '\n'
+
+
+def _splitTokens(input: str) -> List[tuple]:
+    'Tokens are kept along with their line number so the remaining ones can be put back on their lines.'
+    return [(i, t) for i, l in enumerate(input.split('\n')) for t in l.split()]
+
+
+def _joinTokens(tokens: List[tuple]) -> str:
+    lines = {}
+    for i, t in tokens:
+        lines.setdefault(i, []).append(t)
+    return _joinLines([' '.join(lines[i]) for i in sorted(lines.keys())])
+
+
+class _Evaluator:
+    'Memoizes whether candidates fail, fails is called with the candidate and a core from the pool.'
+
+    def __init__(self, fails: Callable[[str, int], bool], pool):
+        self.fails, self.pool, self.evaluations = fails, pool, 0
+        self._memo, self._lock = {}, threading.Lock()
+
+    def __call__(self, candidate: str, cpu: int = None) -> bool:
+        key = hashlib.blake2b(candidate.encode('utf8'), digest_size=16).digest()
+        with self._lock:
+            if key in self._memo:
+                return self._memo[key]
+        res = self.fails(candidate, cpu)
+        with self._lock:
+            self._memo[key] = res
+            self.evaluations += 1
+        return res
+
+    def firstFailing(self, candidates: List[str]) -> int:
+        'Evaluates the candidates concurrently, returns the index of the first one that fails or -1, later candidates are cancelled once its known.'
+        with ThreadPoolExecutor(max_workers=self.pool.jobs) as ex:
+            futures = [ex.submit(self.pool.run, self, c) for c in candidates]
+            try:
+                for i, f in enumerate(futures):
+                    if f.result():
+                        return i
+                return -1
+            finally:
+                for f in futures:
+                    f.cancel()
+
+
+def _ddmin(units: list, join: Callable[[list], str], evaluator: _Evaluator) -> list:
+    n = 2
+    while len(units) >= 2:
+        n = min(n, len(units))
+        bounds = [len(units) * i // n for i in range(n + 1)]
+        subsets = [units[bounds[i]:bounds[i + 1]] for i in range(n)]
+        complements = [units[:bounds[i]] + units[bounds[i + 1]:] for i in range(n)] if n > 2 else []
+        candidates = subsets + complements
+        i = evaluator.firstFailing([join(c) for c in candidates])
+        if i != -1 and i < n:
+            units, n = candidates[i], 2
+        elif i != -1:
+            units, n = candidates[i], max(n - 1, 2)
+        elif n == len(units):
+            break
+        else:
+            n = min(2 * n, len(units))
+    return units
+
+
+def minimize(input: str, fails: Callable[[str, int], bool], pool) -> str:
+    """Returns a reduction of input that still fails, fails(candidate, cpu) must return True if the candidate reproduces the failure.
+    pool is a tester.CorePool used to evaluate candidates concurrently."""
+    evaluator = _Evaluator(fails, pool)
+    lines = _splitLines(input)
+    if evaluator(_joinLines(lines)) == False:
+        logging.warning("The input doesn't fail without its blank lines so it can't be minimized.")
+        return input
+    res = _joinLines(_ddmin(lines, _joinLines, evaluator))
+    tokens = _splitTokens(res)
+    # joining tokens normalizes whitespace which may change the outcome
+    if evaluator(_joinTokens(tokens)):
+        res = _joinTokens(_ddmin(tokens, _joinTokens, evaluator))
+    logging.info(f'Minimized the input from {len(input)} to {len(res)} characters using {evaluator.evaluations} evaluations.')
+    return res
@@ -0,0 +1,91 @@
+// Launches a program and reports its resource usage, used by runner.py.
+// Forking from this tiny process instead of the tester keeps the tester's own memory out of the child's peak RSS,
+// because the kernel records the pre-exec memory map into the child's ru_maxrss.
+// usage: runguard <statsFd> <cpu or -1> <cpuLimitSeconds or 0> <program> [args...]
+// writes "<wait status> <user time us> <system time us> <peak rss KB>" to statsFd once the program exits.
+// SIGTERM kills the program's process group and the stats are still written, so the tester can stop a run without losing its usage.
+// Programs that run their work in a process outside of this tree, like forkclient, can report its usage as "<user time us> <system time us> <peak rss KB>"
+// to the fd in the environment variable CFTESTER_USAGE_FD and it will be added to their own.
+#include <cerrno>
+#include <cstdio>
+#include <cstdlib>
+#include <string>
+#include <algorithm>
+#include <csignal>
+#include <sched.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/resource.h>
+#include <sys/wait.h>
+
+static volatile sig_atomic_t child = 0, terminated = 0;
+
+static void onTerminate(int)
+{
+    terminated = 1;
+    if (child > 0)
+        kill(-child, SIGKILL);
+}
+
+int main(int argc, char **argv)
+{
+    if (argc < 5)
+    {
+        fprintf(stderr, "usage: runguard <statsFd> <cpu> <cpuLimitSeconds> <program> [args...]\n");
+        return 127;
+    }
+    int statsFd = atoi(argv[1]), cpu = atoi(argv[2]), cpuLimit = atoi(argv[3]);
+    fcntl(statsFd, F_SETFD, FD_CLOEXEC);
+    int usagePipe[2];
+    if (pipe(usagePipe) < 0)
+        return 127;
+    fcntl(usagePipe[0], F_SETFD, FD_CLOEXEC);
+    fcntl(usagePipe[0], F_SETFL, O_NONBLOCK);
+    signal(SIGTERM, onTerminate);
+    pid_t pid = fork();
+    if (pid < 0)
+        return 127;
+    if (pid == 0)
+    {
+        signal(SIGTERM, SIG_DFL);
+        setpgid(0, 0);
+        setenv("CFTESTER_USAGE_FD", std::to_string(usagePipe[1]).c_str(), 1);
+        if (cpu >= 0)
+        {
+            cpu_set_t set;
+            CPU_ZERO(&set);
+            CPU_SET(cpu, &set);
+            sched_setaffinity(0, sizeof(set), &set);
+        }
+        if (cpuLimit > 0)
+        {
+            rlimit lim{(rlim_t)cpuLimit, (rlim_t)cpuLimit + 1};
+            setrlimit(RLIMIT_CPU, &lim);
+        }
+        execvp(argv[4], argv + 4);
+        _exit(127);
+    }
+    // both sides set the group so its in place before either of them goes on
+    setpgid(pid, pid);
+    child = pid;
+    if (terminated)
+        kill(-pid, SIGKILL);
+    close(usagePipe[1]);
+    int status = 0;
+    rusage usage{};
+    while (wait4(pid, &status, 0, &usage) < 0)
+        if (errno != EINTR)
+            return 127;
+    long userTime = (long)usage.ru_utime.tv_sec * 1000000 + usage.ru_utime.tv_usec;
+    long sysTime = (long)usage.ru_stime.tv_sec * 1000000 + usage.ru_stime.tv_usec;
+    long maxRss = usage.ru_maxrss;
+    char reported[128]{};
+    long reportedUser, reportedSys, reportedRss;
+    if (read(usagePipe[0], reported, sizeof(reported) - 1) > 0 && sscanf(reported, "%ld %ld %ld", &reportedUser, &reportedSys, &reportedRss) == 3)
+    {
+        userTime += reportedUser, sysTime += reportedSys;
+        maxRss = std::max(maxRss, reportedRss);
+    }
+    dprintf(statsFd, "%d %ld %ld %ld\n", status, userTime, sysTime, maxRss);
+    return 0;
+}
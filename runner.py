@@ -0,0 +1,239 @@
+import os
+import signal
+import subprocess
+import threading
+import logging
+from typing import List
+import compiler
+
+# size of chunks used to stream input and output
+CHUNK_SIZE = 1 << 16
+# bytes of output kept for reports, the rest is only streamed to the output consumer
+KEPT_OUTPUT = 1 << 16
+runguardSource = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'runguard.cpp')
+_runguard: List[str] = None
+_runguardLock = threading.Lock()
+
+
+def _getRunguard() -> List[str]:
+    "Compiles runguard once, returns None if it can't be compiled so runs fall back to measuring from the tester itself."
+    global _runguard
+    with _runguardLock:
+        if _runguard == None:
+            try:
+                _runguard = compiler.compile(runguardSource)
+            except Exception:
+                logging.warning("Couldn't compile runguard, peak memory will include the tester's own memory.")
+                _runguard = []
+        return _runguard if len(_runguard) > 0 else None
+
+
+def pin(pid: int, cpu: int):
+    """Pins the started process to cpu, its called right after Popen since a preexec_fn isn't safe while other threads run
+    and it keeps subprocess from using posix_spawn."""
+    if cpu == None or hasattr(os, 'sched_setaffinity') == False:
+        return
+    try:
+        os.sched_setaffinity(pid, {cpu})
+    except ProcessLookupError:
+        pass
+
+
+def runPinned(args: list, input=None, cpu: int = None, timeout: float = None, check: bool = False, text: bool = False, env: dict = None,
+              stderr=subprocess.STDOUT) -> subprocess.CompletedProcess:
+    """Like subprocess.run capturing stdout, but the process is pinned to cpu and once it runs for more than timeout seconds of wall time
+    it and its children are killed and subprocess.TimeoutExpired is raised."""
+    with subprocess.Popen(args, stdin=None if input == None else subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr, text=text, env=env,
+                          start_new_session=True) as proc:
+        pin(proc.pid, cpu)
+        try:
+            stdout, _ = proc.communicate(input, timeout)
+        except BaseException:
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            raise
+    if check and proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, args, stdout)
+    return subprocess.CompletedProcess(args, proc.returncode, stdout)
+
+
+class ProcessResult:
+    """cpuTime is user + sys time in ms (cpuTimeUs in us) and peakMemory is the peak resident set size in KB, both taken from the kernel rusage of the child.
+    stdout only holds the first KEPT_OUTPUT bytes of the output, outputSize is the size of the whole output."""
+    __slots__ = 'returnCode', 'stdout', 'outputSize', 'cpuTime', 'cpuTimeUs', 'peakMemory', 'timedOut', 'outputLimitExceeded'
+
+    def __init__(self) -> None:
+        self.returnCode, self.stdout, self.outputSize, self.cpuTime, self.cpuTimeUs, self.peakMemory = None, None, 0, None, None, None
+        self.timedOut, self.outputLimitExceeded = False, False
+
+    @property
+    def outputTruncated(self) -> bool:
+        return self.outputSize > KEPT_OUTPUT
+
+
+class CancelToken:
+    """Cancels a group of runs, cancelling kills the runs in flight and the runs started after it are killed right away.
+    Killed runs are reported as timed out."""
+    __slots__ = 'cancelled', '_pids', '_lock'
+
+    def __init__(self):
+        self.cancelled, self._pids, self._lock = False, {}, threading.Lock()
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            for pid, guarded in self._pids.items():
+                _kill(pid, guarded)
+
+    def _add(self, pid: int, guarded: bool) -> bool:
+        'Returns False if its already cancelled.'
+        with self._lock:
+            self._pids[pid] = guarded
+            return self.cancelled == False
+
+    def _remove(self, pid: int):
+        with self._lock:
+            self._pids.pop(pid, None)
+
+
+def _kill(pid: int, guarded: bool):
+    """Kills a run started in its own session, a runguard is only asked to kill its program so it can still report the program's usage.
+    Otherwise a TLE killed by the wall time watchdog before RLIMIT_CPU is reached would lose its cpu time and peak memory."""
+    try:
+        if guarded:
+            os.kill(pid, signal.SIGTERM)
+        else:
+            os.killpg(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def asBuffer(data) -> memoryview:
+    'Returns a byte view over bytes-like data (bytes, memoryview, mmap) without copying it, or None if its not bytes-like.'
+    try:
+        return memoryview(data).cast('B')
+    except TypeError:
+        return None
+
+
+def writeChunks(stream, data):
+    'Writes str, bytes-like (bytes, memoryview, mmap) or binary file data to a binary stream in chunks so no full copy is made.'
+    if data == None:
+        return
+    if isinstance(data, str):
+        for i in range(0, len(data), CHUNK_SIZE):
+            stream.write(data[i:i + CHUNK_SIZE].encode('utf8'))
+        return
+    view = asBuffer(data)
+    if view == None:
+        while True:
+            chunk = data.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            stream.write(chunk)
+    for i in range(0, len(view), CHUNK_SIZE):
+        stream.write(view[i:i + CHUNK_SIZE])
+
+
+def _writeInput(stream, input):
+    try:
+        writeChunks(stream, input)
+    except (BrokenPipeError, OSError):
+        pass
+    finally:
+        try:
+            stream.close()
+        except (BrokenPipeError, OSError):
+            pass
+
+
+def run(args: list, input=None, timeLimit: int = None, cpu: int = None, onOutput=None, outputLimit: int = None, cancel: CancelToken = None) -> ProcessResult:
+    """Runs args feeding it input (str, bytes-like or a binary file) in chunks and returns its resource usage along with the beginning of its output.
+    timeLimit is in ms of CPU time, the process is killed once it exceeds it or twice it in wall time.
+    Each output chunk is passed to onOutput as bytes, and the process is killed once its output exceeds outputLimit bytes.
+    If cpu is provided then the process will be pinned to that core, and if cancel is provided then cancelling it kills the process."""
+    res = ProcessResult()
+    guard = _getRunguard()
+    statsRead = None
+    if guard != None:
+        statsRead, statsWrite = os.pipe()
+        cpuLimitSeconds = 0 if timeLimit == None else timeLimit // 1000 + 1
+        args = guard + [str(statsWrite), str(-1 if cpu == None else cpu), str(cpuLimitSeconds)] + list(args)
+        proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                pass_fds=(statsWrite,), start_new_session=True)
+        os.close(statsWrite)
+    else:
+        proc = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, start_new_session=True)
+        pin(proc.pid, cpu)
+
+    reaped, reapLock = False, threading.Lock()
+
+    def kill(outputLimitExceeded: bool = False):
+        with reapLock:
+            if reaped == False:
+                if outputLimitExceeded:
+                    res.outputLimitExceeded = True
+                else:
+                    res.timedOut = True
+                _kill(proc.pid, guard != None)
+    if cancel != None and cancel._add(proc.pid, guard != None) == False:
+        kill()
+    watchdog = None
+    if timeLimit != None:
+        watchdog = threading.Timer(max(2 * timeLimit, timeLimit + 1000) / 1000, kill)
+        watchdog.start()
+    writer = threading.Thread(target=_writeInput, args=(proc.stdin, input), daemon=True)
+    writer.start()
+    kept = bytearray()
+    try:
+        while True:
+            chunk = proc.stdout.read1(CHUNK_SIZE)
+            if not chunk:
+                break
+            res.outputSize += len(chunk)
+            if len(kept) < KEPT_OUTPUT:
+                kept += chunk[:KEPT_OUTPUT - len(kept)]
+            if outputLimit != None and res.outputSize > outputLimit:
+                kill(True)
+                break
+            if onOutput != None:
+                onOutput(chunk)
+        proc.stdout.close()
+        res.stdout = kept.decode('utf8', errors='replace')
+        # the pid must not be killed by the token once its reaped since it may be reused
+        if cancel != None:
+            cancel._remove(proc.pid)
+        with reapLock:
+            _, status, usage = os.wait4(proc.pid, 0)
+            reaped = True
+            proc.returncode = os.waitstatus_to_exitcode(status)
+    finally:
+        if watchdog != None:
+            watchdog.cancel()
+        writer.join()
+
+    if statsRead != None:
+        with os.fdopen(statsRead, 'r') as stats:
+            line = stats.read().split()
+        if len(line) == 4:
+            status, userTime, sysTime, res.peakMemory = (int(x) for x in line)
+            res.returnCode = os.waitstatus_to_exitcode(status)
+            res.cpuTimeUs = userTime + sysTime
+        else:
+            # runguard itself was killed so the usage of the program is lost
+            res.returnCode, res.cpuTimeUs, res.peakMemory = proc.returncode, 0, 0
+    else:
+        res.returnCode = proc.returncode
+        res.cpuTimeUs = int((usage.ru_utime + usage.ru_stime) * 1000000)
+        res.peakMemory = usage.ru_maxrss
+    res.cpuTime = res.cpuTimeUs // 1000
+    if timeLimit != None:
+        if res.cpuTime != None and res.cpuTime > timeLimit:
+            res.timedOut = True
+        if res.returnCode == -signal.SIGXCPU:
+            res.timedOut = True
+        if res.timedOut and res.outputLimitExceeded == False and res.cpuTime < timeLimit:
+            res.cpuTime, res.cpuTimeUs = timeLimit, timeLimit * 1000
+    return res
@@ -2,10 +2,34 @@ import urllib
 import requests
 import bs4
 import json
+import os
+import time
+import random
+import threading
+import logging
+import hashlib
+import math
+from requests.adapters import HTTPAdapter
+from CriticalExceptionM import CriticalException
+
+# CFTESTER_CF_URL points the tester at another server, like a local stand-in serving recorded CF responses
+CF_BASE_URL = os.environ.get('CFTESTER_CF_URL', 'https://codeforces.com').rstrip('/')
+# requests per second allowed on average, bursts of up to CF_BURST requests are allowed after idle periods
+CF_RATE = float(os.environ.get('CFTESTER_CF_RATE', '2'))
+CF_BURST = 4
+# concurrent CF requests, also the size of the session connection pool
+MAX_WORKERS = 4
+MAX_RETRIES = 4
+_retryStatuses = {429, 500, 502, 503, 504}
+# successful responses are cached on disk here, requests made with a ttl are answered from the cache while its fresh
+CACHE_DIRECTORY = 'HttpCache'
+# seconds data that may still change, like a running contest, is cached for
+CACHE_TTL = float(os.environ.get('CFTESTER_CF_CACHE_TTL', '600'))
+# ttl of data that never changes, like finished contests and submissions
+IMMUTABLE = math.inf
 
 cfSession = requests.sessions.Session()
 cfSession.headers = {
-    'Host': 'codeforces.com',
     'user-agent': r'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/85.0.4183.83 Safari/537.36',
     'X-Requested-With': 'XMLHttpRequest',
     'X-MicrosoftAjax': 'Delta=true',
@@ -16,3 +40,145 @@ cfSession.headers = {
 }
 cfCookies = requests.cookies.RequestsCookieJar()
 cfSession.cookies = cfCookies
+for prefix in ('http://', 'https://'):
+    cfSession.mount(prefix, HTTPAdapter(pool_connections=MAX_WORKERS, pool_maxsize=MAX_WORKERS))
+
+
+class TokenBucket:
+    'Allows rate acquisitions per second on average and up to capacity at once, acquire blocks until a token is available.'
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate, self.capacity = rate, capacity
+        self._tokens, self._last = float(capacity), time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+_bucket = TokenBucket(CF_RATE, CF_BURST)
+
+
+def _cachePath(key: str) -> str:
+    return os.path.join(CACHE_DIRECTORY, hashlib.sha256(f'{CF_BASE_URL} {key}'.encode('utf8')).hexdigest())
+
+
+def cached(key: str) -> requests.Response:
+    'Returns the cached response of key if its still fresh, otherwise None.'
+    try:
+        with open(_cachePath(key), 'rb') as f:
+            meta = json.loads(f.readline())
+            if meta['expires'] != None and meta['expires'] < time.time():
+                return None
+            res = requests.Response()
+            res.status_code, res.url, res._content = meta['status'], meta['url'], f.read()
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+    res.headers = requests.structures.CaseInsensitiveDict(meta['headers'])
+    res.encoding = requests.utils.get_encoding_from_headers(res.headers)
+    return res
+
+
+def _store(key: str, res: requests.Response, ttl: float):
+    path = _cachePath(key)
+    meta = {'status': res.status_code, 'url': res.url, 'headers': dict(res.headers), 'expires': None if ttl == IMMUTABLE else time.time() + ttl}
+    # the body is stored decoded
+    meta['headers'].pop('Content-Encoding', None)
+    meta['headers'].pop('Content-Length', None)
+    os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+    tmpPath = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmpPath, 'wb') as f:
+        f.write(json.dumps(meta).encode('utf8') + b'\n')
+        f.write(res.content)
+    os.replace(tmpPath, path)
+
+
+_keyLocks = {}
+_keyLocksLock = threading.Lock()
+
+
+def _keyLock(key: str) -> threading.Lock:
+    with _keyLocksLock:
+        return _keyLocks.setdefault(key, threading.Lock())
+
+
+def remember(key: str, value, ttl: float):
+    'Caches a json value derived from CF responses under key for ttl seconds, its read back using cached(key).json().'
+    res = requests.Response()
+    res.status_code, res.url, res._content = 200, '', json.dumps(value).encode('utf8')
+    res.headers = requests.structures.CaseInsensitiveDict({'Content-Type': 'application/json'})
+    _store(key, res, ttl)
+
+
+def pin(key: str):
+    'Makes the cached response of key never expire, used once its known to be immutable like the standings of a finished contest.'
+    res = cached(key)
+    if res != None:
+        _store(key, res, IMMUTABLE)
+
+
+def request(method: str, path: str, check: bool = True, ttl: float = None, cacheKey: str = None, **kwargs) -> requests.Response:
+    """Sends a rate limited request to CF_BASE_URL + path using the shared session,
+    connection errors, throttling and server errors are retried with exponential backoff.
+    If check is True then other error statuses raise a CriticalException.
+    If ttl is provided then a fresh cached response is returned without any request, and successful responses are cached for ttl seconds,
+    responses are cached under '<method> <path>' unless cacheKey is provided."""
+    if ttl != None:
+        cacheKey = f'{method} {path}' if cacheKey == None else cacheKey
+        # concurrent requests for the same data wait for the first one then get it from the cache
+        with _keyLock(cacheKey):
+            res = cached(cacheKey)
+            if res == None:
+                res = _send(method, path, check, ttl, cacheKey, **kwargs)
+            return res
+    return _send(method, path, check, ttl, cacheKey, **kwargs)
+
+
+def _send(method: str, path: str, check: bool, ttl: float, cacheKey: str, **kwargs) -> requests.Response:
+    for attempt in range(MAX_RETRIES + 1):
+        _bucket.acquire()
+        try:
+            res = cfSession.request(method, f'{CF_BASE_URL}{path}', timeout=30, **kwargs)
+            if res.status_code not in _retryStatuses:
+                if check and res.status_code >= 400:
+                    raise CriticalException(f'Request to {path} failed with status {res.status_code}.')
+                if ttl != None and res.status_code == 200:
+                    _store(cacheKey, res, ttl)
+                return res
+            error = f'status {res.status_code}'
+        except (requests.ConnectionError, requests.Timeout) as er:
+            error = str(er)
+        if attempt == MAX_RETRIES:
+            raise CriticalException(f'Request to {path} failed after {MAX_RETRIES + 1} attempts: {error}')
+        delay = (2 ** attempt) * (1 + random.random())
+        logging.warning(f'Request to {path} failed ({error}), retrying in {delay:.1f}s.')
+        time.sleep(delay)
+
+
+def get(path: str, **kwargs) -> requests.Response:
+    return request('GET', path, **kwargs)
+
+
+def post(path: str, **kwargs) -> requests.Response:
+    return request('POST', path, **kwargs)
+
+
+def getApi(path: str, ttl: float = None) -> dict:
+    'Calls a CF API method and returns its result, calls rejected for exceeding the call limit are retried.'
+    for attempt in range(MAX_RETRIES + 1):
+        res = get(path, check=False, ttl=ttl).json()
+        if res['status'] == 'OK':
+            return res['result']
+        comment = res.get('comment', '')
+        if 'limit exceeded' not in comment.lower() or attempt == MAX_RETRIES:
+            raise CriticalException(f'CF API call {path} failed: {comment}')
+        time.sleep((2 ** attempt) * (1 + random.random()))
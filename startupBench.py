@@ -0,0 +1,75 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Measures how long cpHelper takes to start for commands that never reach CF, and fails if they load modules only CF commands need
+# or leave files behind, run it after changing imports: python startupBench.py
+cpHelperPath = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cpHelper.py')
+# modules that only commands talking to CF may load
+NETWORK_MODULES = ('requests', 'bs4', 'sessionMan', 'urllib3', 'lxml')
+_probe = """
+import os, runpy, sys
+sys.path.insert(0, os.path.dirname({path!r}))
+sys.argv = [{path!r}] + {args!r}
+try:
+    runpy.run_path({path!r}, run_name='__main__')
+except SystemExit:
+    pass
+print({marker!r})
+print('\\n'.join(sorted(sys.modules)))
+"""
+
+
+def timeStartup(args: list, runs: int, cwd: str) -> float:
+    'Returns the median wall time in ms of running cpHelper with args, or of an empty interpreter if args is None.'
+    cmd = [sys.executable, '-c', 'pass'] if args == None else [sys.executable, cpHelperPath] + args
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(cmd, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times)
+
+
+def loadedModules(args: list, cwd: str) -> set:
+    'Returns the names of the modules loaded by running cpHelper with args.'
+    marker = '--loaded modules--'
+    probe = _probe.format(path=cpHelperPath, args=args, marker=marker)
+    out = subprocess.run([sys.executable, '-c', probe], cwd=cwd, text=True, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True).stdout
+    return set(out.split(marker)[-1].split())
+
+
+def main() -> int:
+    p = argparse.ArgumentParser(description='Benchmarks cpHelper startup for commands that work locally.')
+    p.add_argument('--runs', type=int, default=10, help='Runs of every command, by default its 10.')
+    p.add_argument('--budget', type=float,
+                   help='Fail if the median startup of any command exceeds this many ms, its machine dependent so its not checked by default.')
+    args = p.parse_args()
+    commands = [['-h'], ['test', '-h'], ['stressTest', '-h'], ['bench', '-h']]
+    ok = True
+    with tempfile.TemporaryDirectory() as cwd:
+        print(f'{"Interpreter alone":<20}{timeStartup(None, args.runs, cwd):>10.1f}ms')
+        for c in commands:
+            median = timeStartup(c, args.runs, cwd)
+            loaded = loadedModules(c, cwd)
+            heavy = [m for m in NETWORK_MODULES if m in loaded]
+            print(f'{" ".join(c):<20}{median:>10.1f}ms')
+            if len(heavy) > 0:
+                print(f'  loads {", ".join(heavy)}')
+                ok = False
+            if args.budget != None and median > args.budget:
+                print(f'  exceeds the budget of {args.budget}ms')
+                ok = False
+        leftovers = os.listdir(cwd)
+        if len(leftovers) > 0:
+            print(f'Startup created {", ".join(sorted(leftovers))}')
+            ok = False
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,64 +1,218 @@
 import argparse
 from argparse import FileType
 from os.path import abspath
-from typing import List
+from typing import Dict, List, Tuple
 import dbMan
 import subprocess
 import logging
 import os
 import compiler
+import runner
+import checkers
+import validators
 import time
+import queue
+import tempfile
+import contextlib
+import random
+import minimizer
+import fileWatcher
+import threading
+import tracer
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from CriticalExceptionM import CriticalException
 import colorama
 from colorama import Fore, Style
-_sep = '!@#$%^&*()_ABCDEFG'
+SEPARATOR = '!@#$%^&*()_ABCDEFG'
+# ms of CPU time and MB, used when neither the command line nor the problem has limits
+DEFAULT_TIME_LIMIT = 2000
+DEFAULT_MEMORY_LIMIT = 256
+# MB, solutions printing more than this are killed
+DEFAULT_OUTPUT_LIMIT = 64
+# failure likelihood assumed for tests without history, and the least one given to tests that always passed so they are still ordered by time
+NEW_TEST_FAIL_RATE = 0.1
+MIN_FAIL_RATE = 0.001
+# seconds of wall time a generator or solver run may take before its considered hung and killed
+HELPER_TIMEOUT = float(os.environ.get('CFTESTER_HELPER_TIMEOUT', 60))
+
+
+def _availableCores() -> List[int]:
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class CorePool:
+    """Hands out CPU cores to workers so that every running child is pinned to a core of its own,
+    jobs are capped by the number of available cores so children never compete for the same core."""
+
+    def __init__(self, jobs: int = None):
+        cores = _availableCores()
+        if jobs == None or jobs <= 0 or jobs > len(cores):
+            jobs = len(cores)
+        self.jobs = jobs
+        self._free = queue.Queue()
+        for c in cores[:jobs]:
+            self._free.put(c)
+
+    def run(self, fn, *args, **kwargs):
+        'Calls fn with a free core passed as keyword argument cpu, blocks until a core is free.'
+        cpu = self._free.get()
+        try:
+            return fn(*args, cpu=cpu, **kwargs)
+        finally:
+            self._free.put(cpu)
+
+    def map(self, fn, items: list) -> list:
+        'Runs fn(item, cpu=core) over all items using the pool workers, results keep the order of items.'
+        with ThreadPoolExecutor(max_workers=self.jobs) as ex:
+            return list(ex.map(lambda item: self.run(fn, item), items))
+
+
+def testIdKey(testId: str):
+    'Sorts tests by kind then number, ex: CF2 < CF10 < U1'
+    kind = testId.rstrip('0123456789')
+    num = testId[len(kind):]
+    return (kind, int(num) if num else 0)
+
+
+_whitespace = b' \t\n\r\x0b\x0c'
+
+
+def _isBlank(data) -> bool:
+    if data == None:
+        return True
+    if isinstance(data, str):
+        return len(data) == 0 or data.isspace()
+    view = runner.asBuffer(data)
+    if view == None:
+        return False
+    return next((False for b in view if b not in _whitespace), True)
+
+
+class _OutputSpool:
+    'Keeps the output in memory up to a limit then spills it to a temporary file, also tracks where the stripped output starts and ends.'
+
+    def __init__(self):
+        self._file = tempfile.SpooledTemporaryFile(max_size=1 << 20)
+        self._size, self._start, self._end = 0, None, 0
+
+    def feed(self, chunk: bytes):
+        data = chunk.strip(_whitespace)
+        if len(data) > 0:
+            if self._start == None:
+                self._start = self._size + len(chunk) - len(chunk.lstrip(_whitespace))
+            self._end = self._size + len(chunk.rstrip(_whitespace))
+        self._file.write(chunk)
+        self._size += len(chunk)
+
+    def stripped(self) -> '_BoundedReader':
+        'Returns a binary file positioned to read the stripped output only.'
+        start = self._size if self._start == None else self._start
+        self._file.seek(start)
+        return _BoundedReader(self._file, max(0, self._end - start))
+
+    def close(self):
+        self._file.close()
+
+
+class _BoundedReader:
+    'Reads size bytes of file starting from its current position.'
+    __slots__ = '_file', '_start', 'size', '_left'
+
+    def __init__(self, file, size: int):
+        self._file, self._start, self.size, self._left = file, file.tell(), size, size
+
+    def seek(self, offset: int):
+        self._file.seek(self._start + offset)
+        self._left = self.size - offset
+
+    def read(self, n: int = -1) -> bytes:
+        n = self._left if n < 0 else min(n, self._left)
+        data = self._file.read(n)
+        self._left -= len(data)
+        return data
+
+
+def _preview(data) -> str:
+    'Text of a str or bytes-like payload for reports, large bytes-like payloads are cut at runner.KEPT_OUTPUT bytes.'
+    view = None if isinstance(data, str) else runner.asBuffer(data)
+    if view == None:
+        return data
+    text = bytes(view[:runner.KEPT_OUTPUT]).decode('utf8', errors='replace')
+    if len(view) > runner.KEPT_OUTPUT:
+        text += f'\n... (truncated, {len(view)} bytes in total)'
+    return text
 
 
 class TestResult:
-    __slots__ = 'input', 'output', 'answer', 'verdict', 'elapsed', 'comment', 'testId'
+    'elapsed is the CPU time of the solution in ms and memory is its peak resident set size in KB.'
+    __slots__ = 'input', 'output', 'answer', 'verdict', 'elapsed', 'memory', 'comment', 'testId'
 
     def __init__(self) -> None:
-        self.input, self.output, self.answer, self.verdict, self.elapsed, self.comment, self.testId = None, None, None, None, None, None, None
+        self.input, self.output, self.answer, self.verdict, self.elapsed, self.memory, self.comment, self.testId = None, None, None, None, None, None, None, None
 
     @property
     def passed(self):
         return self.verdict == 'Accepted'
 
     @staticmethod
-    def runTest(input: str, answer: str, exe: list, testId: str = None, validator: list = None, validatorSep: str = None, validatorAdditionalData: str = None):
-        """validator will receive input, output, answer and additional info all separated by --seperator.
-        If answer is None or a whitespace then a validator must be provided"""
-        if (answer == None or str.isspace(answer)) and validator == None:
+    def runTest(input, answer, exe: list, testId: str = None, validator=None, validatorSep: str = None, validatorAdditionalData: str = None, cpu: int = None,
+                timeLimit: int = DEFAULT_TIME_LIMIT, memoryLimit: int = DEFAULT_MEMORY_LIMIT, outputLimit: int = DEFAULT_OUTPUT_LIMIT, checker=None,
+                cancel: runner.CancelToken = None):
+        """validator will receive input, output, answer and additional info all separated by --seperator,
+        it can be either a list of args to start for every check or a validators.PersistentValidator.
+        If answer is None or a whitespace then a validator must be provided.
+        If there is no validator then the output is checked in-process by checker which is one of checkers.getChecker results, by default its exact comparison.
+        input and answer can be str, bytes-like or binary files, they are streamed to the solution and compared against its output in chunks.
+        If cpu is provided then the solution and validator will be pinned to that core, cancel kills the solution once its cancelled.
+        timeLimit is in ms of CPU time, memoryLimit and outputLimit are in MB."""
+        if _isBlank(answer) and validator == None:
             raise CriticalException('Parameter "answer" can\'t be None or a whitespace without providing a validator.')
         res = TestResult()
         res.answer = answer
         res.input = input
         res.testId = testId
-        validator = None if validator == None else list(validator)
-        try:
-            res.elapsed = time.time_ns()
-            proc = subprocess.run(exe, text=True, input=input, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, timeout=5, check=True)
-        except subprocess.TimeoutExpired:
-            res.elapsed = time.time_ns() - res.elapsed
-            res.verdict = 'Timedout'
-        except subprocess.CalledProcessError:
-            res.elapsed = time.time_ns() - res.elapsed
-            res.verdict = 'Non-zero exit'
+        if validator != None:
+            consumer = _OutputSpool()
         else:
-            res.elapsed = time.time_ns() - res.elapsed
+            consumer = (checkers.ExactChecker if checker == None else checker)(answer)
+        try:
+            with tracer.span('solution', 'process'):
+                proc = runner.run(exe, input, timeLimit, cpu, consumer.feed, None if outputLimit == None else outputLimit * 1024 * 1024, cancel)
+            res.elapsed, res.memory = proc.cpuTime, proc.peakMemory
             res.output = proc.stdout.strip()
-            if validator == None:
-                if res.output == answer:
+            if proc.outputTruncated:
+                res.output += f'\n... (truncated, {proc.outputSize} bytes in total)'
+            if proc.outputLimitExceeded:
+                res.verdict = 'Output limit exceeded'
+            elif proc.timedOut:
+                res.verdict = 'Timedout'
+            elif memoryLimit != None and res.memory > memoryLimit * 1024:
+                res.verdict = 'Memory limit exceeded'
+            elif proc.returnCode != 0:
+                res.verdict = 'Non-zero exit'
+            elif validator == None:
+                with tracer.span('checker'):
+                    ok, comment = consumer.finish()
+                if ok:
                     res.verdict, res.comment = 'Accepted', None
                 else:
-                    res.verdict, res.comment = 'Worng answer', "Output doesn't match answer"
+                    res.verdict, res.comment = 'Worng answer', comment
             else:
-                valProc = subprocess.run(validator, text=True, input=f'\n{validatorSep}\n'.join([input, res.output, answer, validatorAdditionalData]), stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-                if valProc.returncode == 0:
+                with tracer.span('validator', 'process'):
+                    if isinstance(validator, validators.PersistentValidator):
+                        valCode, valOutput = validator.check(input, consumer.stripped(), answer, validatorAdditionalData, cpu)
+                    else:
+                        sep = f'\n{validatorSep}\n'
+                        valCode, valOutput = validators.runOnce(validator, [input, sep, consumer.stripped(), sep, answer, sep, validatorAdditionalData], cpu)
+                if valCode == 0:
                     res.verdict, res.comment = 'Accepted', None
                 else:
-                    res.verdict, res.comment = 'Worng answer', valProc.stdout
-        res.elapsed //= 1000000
+                    res.verdict, res.comment = 'Worng answer', valOutput
+        finally:
+            if validator != None:
+                consumer.close()
         return res
 
     def __str__(self):
@@ -67,10 +221,11 @@ class TestResult:
             l.append(f'Test Id: {self.testId}')
         l.append(f'Verdict: {self.verdict}')
         l.append(f'Elapsed: {self.elapsed}')
+        l.append(f'Memory: {self.memory}KB')
         if self.passed != True:
-            l.append(f'Input:\n{self.input}')
+            l.append(f'Input:\n{_preview(self.input)}')
             l.append(f'Output:\n{self.output}')
-            l.append(f'Answer:\n{self.answer}')
+            l.append(f'Answer:\n{_preview(self.answer)}')
             l.append(f'Comment:\n{self.comment}')
         return '\n'.join(l)
 
@@ -78,115 +233,558 @@ class TestResult:
         return self.__str__()
 
 
-def testProblem(userId: str, sourcePath: str, cfTestsIds: List[int] = None, uTestsIds: List[int] = None, validatorPath: str = None) -> None:
-    prob = dbMan.Problem.getByUserId(userId)
-    exe = compiler.compile(abspath(sourcePath))
-    if validatorPath != None:
-        val = compiler.compile(abspath(validatorPath))
-        val += ['--seperator', _sep]
-    else:
-        val = None
+def problemLimits(prob: dbMan.Problem, timeLimit: int = None, memoryLimit: int = None) -> Tuple[int, int]:
+    'Explicit limits win over the problem ones which win over the defaults.'
+    if timeLimit == None:
+        timeLimit = DEFAULT_TIME_LIMIT if prob == None or prob.timeLimit == None else prob.timeLimit
+    if memoryLimit == None:
+        memoryLimit = DEFAULT_MEMORY_LIMIT if prob == None or prob.memoryLimit == None else prob.memoryLimit
+    return timeLimit, memoryLimit
 
-    ts = dbMan.TestSet(prob.id, cfTestsIds, uTestsIds)
-    if len(ts.tests) == 0:
-        print(f'{Fore.RED}No tests where found{Fore.RESET}')
-        return
+
+def _validator(val: list, persistent: bool):
+    'Turns the compiled validator args into what runTest expects, returns None if there is no validator.'
+    if val == None:
+        return None
+    if persistent:
+        return validators.PersistentValidator(val)
+    return val + ['--seperator', SEPARATOR]
+
+
+@contextlib.contextmanager
+def _closingValidator(val):
+    try:
+        yield val
+    finally:
+        if isinstance(val, validators.PersistentValidator):
+            val.close()
+
+
+def _printReport(results: List[TestResult], timeLimit: int, memoryLimit: int):
     failedTests = []
     maxElapsed: TestResult = None
-    for t in ts.tests:
-        tr = TestResult.runTest(t.input, t.answer, exe, t.id, val, _sep, '')
+    maxMemory: TestResult = None
+    for tr in results:
         if tr.passed == False:
             failedTests.append(tr)
         if maxElapsed == None or tr.elapsed > maxElapsed.elapsed:
             maxElapsed = tr
-    print(f'Ran {len(ts.tests)} tests, {len(ts.tests) - len(failedTests)} {Fore.GREEN}passed{Fore.RESET} and {len(failedTests)} {Fore.RED}failed{Fore.RESET}')
-    print(f'Max elapsed test is {maxElapsed.testId} and it took {maxElapsed.elapsed}ms')
+        if maxMemory == None or tr.memory > maxMemory.memory:
+            maxMemory = tr
+    failedTests.sort(key=lambda tr: testIdKey(tr.testId))
+    print(f'Ran {len(results)} tests, {len(results) - len(failedTests)} {Fore.GREEN}passed{Fore.RESET} and {len(failedTests)} {Fore.RED}failed{Fore.RESET}')
+    print(f'Max elapsed test is {maxElapsed.testId} and it took {maxElapsed.elapsed}ms of {timeLimit}ms')
+    print(f'Max memory test is {maxMemory.testId} and it used {maxMemory.memory}KB of {memoryLimit}MB')
     if len(failedTests) > 0:
         print(f'{Fore.RED}Failed{Fore.RESET} tests are:')
         for t in failedTests:
             print(t)
 
 
-def stressTest(sourcePath: str, n: int, generatorPath: str, outputPath: str, validatorPath: str = None, solverPath: str = None):
+def scheduleTests(tests: list, history: Dict[str, dbMan.TestHistory]) -> list:
+    """Orders the tests by their likelihood of failing per expected ms of CPU time so failures are found as early as possible,
+    which puts cheap tests and tests that failed recently first. Tests without history are assumed to take the median time of the others."""
+    times = sorted(h.cpuTime for h in history.values())
+    defaultTime = times[len(times) // 2] if len(times) > 0 else 0
+
+    def key(t: dbMan.Test) -> float:
+        h = history.get(t.id)
+        failRate, cpuTime = (NEW_TEST_FAIL_RATE, defaultTime) if h == None else (max(h.failRate, MIN_FAIL_RATE), h.cpuTime)
+        return -failRate / (cpuTime + 1)
+    return sorted(tests, key=key)
+
+
+def testProblem(userId: str, sourcePath: str, cfTestsIds: List[int] = None, uTestsIds: List[int] = None, validatorPath: str = None, jobs: int = None,
+                timeLimit: int = None, memoryLimit: int = None, outputLimit: int = DEFAULT_OUTPUT_LIMIT, checker: str = None,
+                persistentValidator: bool = False, failFast: bool = False) -> None:
+    """Tests are run in scheduleTests order and their outcomes are added to the problem TestHistory.
+    If failFast is True then the run stops at the first failed test, the tests running at that moment are killed and left out of the report."""
+    prob = dbMan.Problem.getByUserId(userId)
+    check = checkers.getChecker(checker)
+    timeLimit, memoryLimit = problemLimits(prob, timeLimit, memoryLimit)
+    exe, val = compiler.compileAll(abspath(sourcePath), None if validatorPath == None else abspath(validatorPath))
+
+    ts = dbMan.TestSet(prob.id, cfTestsIds, uTestsIds)
+    if len(ts) == 0:
+        print(f'{Fore.RED}No tests where found{Fore.RESET}')
+        return
+    cancel, cancelLock = runner.CancelToken(), threading.Lock()
+
+    def runTest(t: dbMan.Test, cpu: int) -> TestResult:
+        if cancel.cancelled:
+            return None
+        # payloads are loaded by the worker and only kept for failed tests reports
+        tr = TestResult.runTest(t.input, t.answer, exe, t.id, val, SEPARATOR, '', cpu, timeLimit, memoryLimit, outputLimit, check, cancel)
+        with cancelLock:
+            if cancel.cancelled:
+                return None
+            if failFast and tr.passed == False:
+                cancel.cancel()
+        if tr.passed:
+            tr.input, tr.answer = None, None
+        return tr
+    with _closingValidator(_validator(val, persistentValidator)) as val:
+        results = [tr for tr in CorePool(jobs).map(runTest, scheduleTests(ts, dbMan.TestHistory.get(prob.id))) if tr != None]
+    dbMan.TestHistory.record(prob.id, [(tr.testId, tr.passed, tr.elapsed) for tr in results])
+    if len(results) < len(ts):
+        print(f'Stopped at the first failed test, {len(ts) - len(results)} tests were skipped.')
+    _printReport(results, timeLimit, memoryLimit)
+
+
+def watchProblem(userId: str, sourcePath: str, cfTestsIds: List[int] = None, uTestsIds: List[int] = None, validatorPath: str = None, jobs: int = None,
+                 timeLimit: int = None, memoryLimit: int = None, outputLimit: int = DEFAULT_OUTPUT_LIMIT, checker: str = None,
+                 persistentValidator: bool = False) -> None:
+    """Tests the solution every time it or the validator is saved until interrupted, the tests that failed in the last run go first.
+    A save while tests are running cancels the run, the tests payloads, the validator and the db connection are kept between runs."""
+    prob = dbMan.Problem.getByUserId(userId)
+    if prob == None:
+        raise CriticalException(f'There is no problem with id: {userId} in db.')
+    check = checkers.getChecker(checker)
+    timeLimit, memoryLimit = problemLimits(prob, timeLimit, memoryLimit)
+    tests = [(t.id, t.input, t.answer) for t in dbMan.TestSet(prob.id, cfTestsIds, uTestsIds)]
+    if len(tests) == 0:
+        print(f'{Fore.RED}No tests where found{Fore.RESET}')
+        return
+    paths = [abspath(sourcePath)] + ([] if validatorPath == None else [abspath(validatorPath)])
+    pool = CorePool(jobs)
+    failed, validator, validatorHash = set(), None, None
+
+    def iteration(cancel: runner.CancelToken):
+        nonlocal failed, validator, validatorHash
+        try:
+            exe = compiler.compile(paths[0])
+            if validatorPath != None and validatorHash != compiler.sourceHash(paths[1]):
+                h, newValidator = compiler.sourceHash(paths[1]), _validator(compiler.compile(paths[1]), persistentValidator)
+                if isinstance(validator, validators.PersistentValidator):
+                    validator.close()
+                validator, validatorHash = newValidator, h
+        except (CriticalException, OSError) as er:
+            print(f'{Fore.RED}{er}{Fore.RESET}')
+            return
+        val = validator
+
+        def runTest(t: tuple, cpu: int) -> TestResult:
+            if cancel.cancelled:
+                return None
+            tr = TestResult.runTest(t[1], t[2], exe, t[0], val, SEPARATOR, '', cpu, timeLimit, memoryLimit, outputLimit, check, cancel)
+            if tr.passed:
+                tr.input, tr.answer = None, None
+            return tr
+        # sorting is stable so the tests keep their order within the failed ones and the rest
+        results = pool.map(runTest, sorted(tests, key=lambda t: t[0] not in failed))
+        if cancel.cancelled:
+            return
+        failed = {tr.testId for tr in results if tr.passed == False}
+        _printReport(results, timeLimit, memoryLimit)
+
+    print(f'Watching {", ".join(paths)}, press Ctrl+C to stop.')
+    hashes, run, cancel = None, None, None
+    with fileWatcher.FileWatcher(paths) as watcher:
+        try:
+            while True:
+                try:
+                    newHashes = [compiler.sourceHash(p) for p in paths]
+                except OSError:
+                    # the file is being replaced, the save that completes it will be reported too
+                    newHashes = hashes
+                # saves that don't change the content, like touching the file, are ignored
+                if newHashes != hashes:
+                    hashes = newHashes
+                    if run != None and run.is_alive():
+                        print(f'{Style.DIM}Cancelling the running tests.{Style.RESET_ALL}')
+                    if cancel != None:
+                        cancel.cancel()
+                        run.join()
+                    print(f'{Style.DIM}[{time.strftime("%H:%M:%S")}] Running {len(tests)} tests.{Style.RESET_ALL}')
+                    cancel = runner.CancelToken()
+                    run = threading.Thread(target=iteration, args=(cancel,), daemon=True)
+                    run.start()
+                watcher.wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if cancel != None:
+                cancel.cancel()
+                run.join()
+            if isinstance(validator, validators.PersistentValidator):
+                validator.close()
+
+
+def _runGenerator(seed: int, gen: list, cpu: int = None) -> str:
+    'The seed is passed to the generator through the environment variable CFTESTER_SEED.'
+    with tracer.span('generator', 'process'):
+        return runner.runPinned(gen, cpu=cpu, timeout=HELPER_TIMEOUT, check=True, text=True, env=dict(os.environ, CFTESTER_SEED=str(seed))).stdout
+
+
+def _generateCase(seed: int, gen: list, cpu: int = None) -> List[str]:
+    'Returns the generator test case, answer and additional data.'
+    return _runGenerator(seed, gen, cpu).split(SEPARATOR, 3)
+
+
+def _generateCases(firstSeed: int, count: int, gen: list, cpu: int = None) -> List[List[str]]:
+    """The generator gets --count and may print count records of test case, answer and additional data each followed by --seperator,
+    record j being the case it prints for seed CFTESTER_SEED + j, generators that print a single case are called once per case instead."""
+    fields = _runGenerator(firstSeed, gen + ['--count', str(count)], cpu).split(SEPARATOR)
+    if len(fields) > 3 * count:
+        return [fields[3 * j:3 * j + 3] for j in range(count)]
+    return [fields[:3]] + [_generateCase(firstSeed + j, gen, cpu) for j in range(1, count)]
+
+
+def _runSolver(sol: list, input: str, cpu: int = None) -> str:
+    with tracer.span('solver', 'process'):
+        return runner.runPinned(sol, input, cpu, HELPER_TIMEOUT, check=True, text=True).stdout.strip()
+
+
+class _CorpusSession:
+    'Memoizes the solver answers of a stress test run in the problem corpus, see dbMan.Corpus. Its shared by the iterations.'
+    __slots__ = 'problemId', 'solverKey', '_new', '_lock'
+    # new cases are written to the db in chunks of this many cases
+    FLUSH_SIZE = 256
+
+    def __init__(self, problemId: int, solverKey: str):
+        self.problemId, self.solverKey, self._new, self._lock = problemId, solverKey, [], threading.Lock()
+
+    def cases(self) -> List[dbMan.Corpus]:
+        return dbMan.Corpus.cases(self.problemId, self.solverKey)
+
+    def answerOf(self, input: str) -> str:
+        return dbMan.Corpus.answerOf(self.problemId, self.solverKey, input)
+
+    def add(self, input: str, answer: str, additionalData: str):
+        with self._lock:
+            self._new.append((input, answer, additionalData))
+            if len(self._new) < _CorpusSession.FLUSH_SIZE:
+                return
+            new, self._new = self._new, []
+        dbMan.Corpus.add(self.problemId, self.solverKey, new)
+
+    def flush(self):
+        with self._lock:
+            new, self._new = self._new, []
+        if len(new) > 0:
+            dbMan.Corpus.add(self.problemId, self.solverKey, new)
+
+
+def _stressIteration(seed: int, gen: list, exe: list, val: list, sol: list, timeLimit: int, memoryLimit: int, outputLimit: int, check, cpu: int = None,
+                     corpus: _CorpusSession = None, cancel: runner.CancelToken = None) -> TestResult:
+    'If corpus is provided then the solver only runs for inputs that are not in it, and the case is added to it. cancel kills the solution once its cancelled.'
+    gpo = _generateCase(seed, gen, cpu)
+    sln = gpo[1]
+    if sol != None:
+        sln = None if corpus == None else corpus.answerOf(gpo[0])
+        if sln == None:
+            sln = _runSolver(sol, gpo[0], cpu)
+        if corpus != None:
+            corpus.add(gpo[0], sln, gpo[2])
+    return TestResult.runTest(gpo[0], sln, exe, validator=val, validatorSep=SEPARATOR, validatorAdditionalData=gpo[2], cpu=cpu,
+                               timeLimit=timeLimit, memoryLimit=memoryLimit, outputLimit=outputLimit, checker=check, cancel=cancel)
+
+
+def _replayCase(case: dbMan.Corpus, exe: list, val: list, timeLimit: int, memoryLimit: int, outputLimit: int, check, cpu: int = None,
+                cancel: runner.CancelToken = None) -> TestResult:
+    return TestResult.runTest(case.input, case.answer, exe, validator=val, validatorSep=SEPARATOR, validatorAdditionalData=case.additionalData, cpu=cpu,
+                              timeLimit=timeLimit, memoryLimit=memoryLimit, outputLimit=outputLimit, checker=check, cancel=cancel)
+
+
+def _runBatch(cases: List[List[str]], exe: list, val: list, sol: list, timeLimit: int, memoryLimit: int, outputLimit: int, check, cpu: int = None,
+              cancel: runner.CancelToken = None) -> TestResult:
+    """Packs the generated cases into one input that starts with their count, the answer is the generator answers one after the other or the solver answer to the whole input.
+    Its only used without a validator, which expects a single case."""
+    input = f'{len(cases)}\n' + ''.join(c[0] if c[0].endswith('\n') else c[0] + '\n' for c in cases)
+    sln = '\n'.join(c[1].strip() for c in cases) if sol == None else _runSolver(sol, input, cpu)
+    return TestResult.runTest(input, sln, exe, cpu=cpu, timeLimit=timeLimit, memoryLimit=memoryLimit, outputLimit=outputLimit, checker=check, cancel=cancel)
+
+
+def _stressBatch(firstSeed: int, count: int, gen: list, exe: list, val: list, sol: list, timeLimit: int, memoryLimit: int, outputLimit: int, check,
+                 cpu: int = None, cancel: runner.CancelToken = None) -> Tuple[TestResult, int, int]:
+    """Runs the cases of seeds firstSeed to firstSeed + count - 1 as one multi-case input, a failed batch is bisected to the single case that fails by itself.
+    Returns the result along with the range [start, end) of the cases it covers, which is larger than one case if the cases only fail together."""
+    cases = _generateCases(firstSeed, count, gen, cpu)
+    t = _runBatch(cases, exe, val, sol, timeLimit, memoryLimit, outputLimit, check, cpu, cancel)
+    start, end = 0, len(cases)
+    while t.passed == False and end - start > 1 and (cancel == None or cancel.cancelled == False):
+        mid = (start + end) // 2
+        first = _runBatch(cases[start:mid], exe, val, sol, timeLimit, memoryLimit, outputLimit, check, cpu, cancel)
+        if first.passed == False:
+            t, end = first, mid
+            continue
+        second = _runBatch(cases[mid:end], exe, val, sol, timeLimit, memoryLimit, outputLimit, check, cpu, cancel)
+        if second.passed == False:
+            t, start = second, mid
+            continue
+        break
+    return t, start, end
+
+
+def _reproduce(input: str, answer: str, exe: list, val, sol: list, timeLimit: int, memoryLimit: int, outputLimit: int, check, cpu: int = None) -> TestResult:
+    'Runs a reduced stress case, its answer is taken from the solver when there is one, returns None if the solver rejects the input or hangs on it.'
+    if sol != None:
+        try:
+            with tracer.span('solver', 'process'):
+                solProc = runner.runPinned(sol, input, cpu, HELPER_TIMEOUT, text=True, stderr=subprocess.DEVNULL)
+        except subprocess.TimeoutExpired:
+            return None
+        if solProc.returncode != 0:
+            return None
+        answer = solProc.stdout.strip()
+    return TestResult.runTest(input, answer, exe, validator=val, validatorSep=SEPARATOR, validatorAdditionalData='', cpu=cpu,
+                               timeLimit=timeLimit, memoryLimit=memoryLimit, outputLimit=outputLimit, checker=check)
+
+
+@tracer.traced('run')
+def _minimizeFailure(failed: TestResult, outputPath: str, exe: list, val, sol: list, timeLimit: int, memoryLimit: int, outputLimit: int, check,
+                     pool: CorePool, saveProblemId: str = None):
+    """Shrinks the failed case input keeping only reductions that fail with the same verdict, writes it next to outputPath and saves it as a U test of saveProblemId.
+    Reductions are checked with the solver answer when there is a solver, otherwise the validator gets an empty answer and additional data."""
+    if sol == None and val == None and failed.verdict == 'Worng answer':
+        print(f"{Fore.RED}Can't minimize a wrong answer without a solver or a validator{Fore.RESET}")
+        return
+    answer = failed.answer if sol == None and val == None else None
+    # inputs stored in blob files are loaded as mmaps, the minimizer splits text so they are decoded first
+    input = failed.input
+    if isinstance(input, str) == False:
+        with runner.asBuffer(input) as view:
+            input = bytes(view).decode('utf8', errors='replace')
+
+    def fails(input: str, cpu: int = None) -> bool:
+        t = _reproduce(input, answer, exe, val, sol, timeLimit, memoryLimit, outputLimit, check, cpu)
+        return t != None and t.verdict == failed.verdict
+    print('Minimizing the failed case')
+    started = time.perf_counter()
+    with _closingValidator(val):
+        minInput = minimizer.minimize(input, fails, pool)
+        t = _reproduce(minInput, answer, exe, val, sol, timeLimit, memoryLimit, outputLimit, check)
+    minPath = f'{os.path.splitext(outputPath)[0]}.min.txt'
+    with open(minPath, 'w') as opt:
+        opt.write(f"{'#' * 150}\n")
+        opt.write(f"{t}\n")
+        opt.write(f"{'#' * 150}")
+    print(f'Minimized the input from {len(input.splitlines())} to {len(minInput.splitlines())} lines in {time.perf_counter() - started:.2f}s, see file {minPath}')
+    if saveProblemId != None:
+        ids = dbMan.TestSet.loadTestSet(saveProblemId, [(minInput, None if sol == None else t.answer)])
+        print(f'Saved the minimized case as test {ids[0]} of problem {saveProblemId}')
+
+
+def stressTest(sourcePath: str, n: int, generatorPath: str, outputPath: str, validatorPath: str = None, solverPath: str = None, jobs: int = None, seed: int = None,
+               timeLimit: int = DEFAULT_TIME_LIMIT, memoryLimit: int = DEFAULT_MEMORY_LIMIT, outputLimit: int = DEFAULT_OUTPUT_LIMIT,
+               checker: str = None, persistentValidator: bool = False, minimize: bool = False, saveProblemId: str = None, batch: int = 1, corpusProblemId: int = None):
     """generator must first print the test case, answer(can be empty) and additional info(can be empty) for the validator all seperated by argument --seperator
-    if a solver is provided then generator answer will be ignored and instead solver will be called and its answer will be provided to the validator"""
+    if a solver is provided then generator answer will be ignored and instead solver will be called and its answer will be provided to the validator.
+    Iterations run in parallel over a pool of core-pinned workers, iteration i gets seed + i so any failure can be reproduced using its seed.
+    If batch is more than 1 then the solution and solver run once for every batch of cases packed into a multi-case input, see _stressBatch,
+    the limits apply to the whole batch and there can't be a validator since validators check a single case.
+    If minimize is True then a failed case is minimized and optionally saved as a U test of saveProblemId.
+    If corpusProblemId is provided along with a solver and batch is 1 then the cases of the problem corpus are replayed first using their stored answers,
+    and the solver answers of the generated cases are memoized in the corpus."""
 
-    exe, gen = compiler.compile(abspath(sourcePath)), compiler.compile(abspath(generatorPath))
+    if batch > 1 and validatorPath != None:
+        raise CriticalException("--batch can't be used with a validator since validators check a single case, the batch output would have to be split per case.")
+    exe, gen, val, sol = compiler.compileAll(*(None if p == None else abspath(p) for p in (sourcePath, generatorPath, validatorPath, solverPath)))
     gen.append('--seperator')
-    gen.append(_sep)
-    if validatorPath != None:
-        val = compiler.compile(abspath(validatorPath))
-        val.append('--seperator')
-        val.append(_sep)
-    else:
-        val = None
+    gen.append(SEPARATOR)
+    val = _validator(val, persistentValidator)
+    check = checkers.getChecker(checker)
 
-    sol = None if solverPath == None else compiler.compile(abspath(solverPath))
+    if seed == None:
+        seed = random.randrange(1 << 31)
+    pool = CorePool(jobs)
+    print(f'Stress testing using {pool.jobs} workers and seed {seed}')
 
-    allGood = True
+    batch = max(1, batch)
+    corpus = _CorpusSession(corpusProblemId, compiler.executableKey(abspath(solverPath))) if corpusProblemId != None and sol != None and batch == 1 else None
+    failed: Tuple[int, int, TestResult] = None
+    replayFailed: Tuple[int, TestResult] = None
     maxElapsed: TestResult = None
-    for i in range(1, n + 1):
-        print(f'Test case #{i}: ', end='')
-        genProc = subprocess.run(gen, text=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=True)
-        gpo = genProc.stdout.split(_sep, 3)
-        sln = gpo[1] if sol == None else subprocess.run(sol, text=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, check=True, input=gpo[0]).stdout.strip()
-        t = TestResult.runTest(gpo[0], sln, exe, validator=val, validatorSep=_sep, validatorAdditionalData=gpo[2])
-        if t.passed == False:
-            with open(outputPath, 'a+') as opt:
-                opt.write(f"{'#' * 150}\n")
-                opt.write(f"{t}\n")
-                opt.write(f"{'#' * 150}")
-            print(f'{Fore.RED}Failed{Fore.RESET}, see file {outputPath} for additional info')
-            allGood = False
-            break
-        if maxElapsed == None or t.elapsed > maxElapsed.elapsed:
-            maxElapsed = t
-        print(f'{Fore.GREEN}Passed{Fore.RESET}')
-    if allGood == False:
-        return
-    print(f'Ran {n} tests {Fore.GREEN}successfully{Fore.RESET}')
-    print(f'Max elapsed test took {maxElapsed.elapsed}ms')
+    maxMemory: TestResult = None
+    ran, nextIteration, pending = 0, 1, {}
+    cases = [] if corpus == None else corpus.cases()
+    nextCase = 1
+    # cancelled on the first failure so the iterations in flight are killed, their results are ignored
+    cancel = runner.CancelToken()
+    started = time.perf_counter()
+
+    def runIterations(first: int, count: int, cpu: int) -> Tuple[TestResult, int, int]:
+        if cancel.cancelled:
+            return None
+        if batch == 1:
+            return _stressIteration(seed + first, gen, exe, val, sol, timeLimit, memoryLimit, outputLimit, check, cpu, corpus, cancel), 0, 1
+        return _stressBatch(seed + first, count, gen, exe, val, sol, timeLimit, memoryLimit, outputLimit, check, cpu, cancel)
+
+    def replay(k: int, cpu: int) -> Tuple[TestResult, int, int]:
+        if cancel.cancelled:
+            return None
+        return _replayCase(cases[k - 1], exe, val, timeLimit, memoryLimit, outputLimit, check, cpu, cancel), 0, 1
+    if len(cases) > 0:
+        print(f'Replaying {len(cases)} corpus cases')
+    with ThreadPoolExecutor(max_workers=pool.jobs) as ex, _closingValidator(val):
+        while nextCase <= len(cases) or nextIteration <= n or len(pending) > 0:
+            # keep a bounded number of iterations in flight so a failure doesn't leave a huge backlog to cancel, the corpus cases go first
+            while failed == None and replayFailed == None and (nextCase <= len(cases) or nextIteration <= n) and len(pending) < pool.jobs * 2:
+                if nextCase <= len(cases):
+                    pending[ex.submit(pool.run, replay, nextCase)] = (True, nextCase, 1)
+                    nextCase += 1
+                    continue
+                count = min(batch, n - nextIteration + 1)
+                pending[ex.submit(pool.run, runIterations, nextIteration, count)] = (False, nextIteration, count)
+                nextIteration += count
+            if len(pending) == 0:
+                break
+            done, _ = wait(pending.keys(), return_when=FIRST_COMPLETED)
+            for f in done:
+                replayed, i, count = pending.pop(f)
+                if f.cancelled() or cancel.cancelled:
+                    continue
+                t, start, end = f.result()
+                ran += count
+                if t.passed == False:
+                    if replayed:
+                        replayFailed = (i, t)
+                    else:
+                        failed = (i + start, i + end - 1, t)
+                    cancel.cancel()
+                    for p in pending.keys():
+                        p.cancel()
+                    continue
+                if maxElapsed == None or t.elapsed > maxElapsed.elapsed:
+                    maxElapsed = t
+                if maxMemory == None or t.memory > maxMemory.memory:
+                    maxMemory = t
+                if replayed:
+                    print(f'Corpus case #{i}: {Fore.GREEN}Passed{Fore.RESET}')
+                elif count == 1:
+                    print(f'Test case #{i}: {Fore.GREEN}Passed{Fore.RESET}')
+                else:
+                    print(f'Test cases #{i}-#{i + count - 1}: {Fore.GREEN}Passed{Fore.RESET}')
+    if len(cases) > 0 and replayFailed == None:
+        dbMan.Corpus.touch(corpus.problemId, corpus.solverKey, [c.inputHash for c in cases])
+    elapsed = time.perf_counter() - started
+    if corpus != None:
+        corpus.flush()
+
+    if failed != None or replayFailed != None:
+        t = failed[2] if replayFailed == None else replayFailed[1]
+        with open(outputPath, 'a+') as opt:
+            opt.write(f"{'#' * 150}\n")
+            opt.write(f"{t}\n")
+            opt.write(f"{'#' * 150}")
+        if replayFailed != None:
+            print(f'Corpus case #{replayFailed[0]}: {Fore.RED}Failed{Fore.RESET}, see file {outputPath} for additional info')
+        elif failed[0] == failed[1]:
+            print(f'Test case #{failed[0]}: {Fore.RED}Failed{Fore.RESET} using seed {seed + failed[0]}, see file {outputPath} for additional info')
+        else:
+            i, last, _ = failed
+            print(f'Test cases #{i}-#{last}: {Fore.RED}Failed{Fore.RESET} together but not alone using seeds {seed + i}-{seed + last}, see file {outputPath} for additional info')
+        if minimize:
+            _minimizeFailure(t, outputPath, exe, val, sol, timeLimit, memoryLimit, outputLimit, check, pool, saveProblemId)
+    else:
+        print(f'Ran {ran} tests {Fore.GREEN}successfully{Fore.RESET}')
+        print(f'Max elapsed {"batch" if batch > 1 else "test"} took {maxElapsed.elapsed}ms')
+        print(f'Max memory {"batch" if batch > 1 else "test"} used {maxMemory.memory}KB')
+    print(f'Throughput: {ran / elapsed:.2f} iterations per second')
+
+
+def splitTestsIds(strList: str) -> List[int]:
+    'Parses tests numbers like 1,2,4-6,10'
+    res = []
+    for i in (i.strip() for i in strList.split(',')):
+        if i.find('-') == -1:
+            res.append(int(i))
+        else:
+            s, e = [int(j.strip()) for j in i.split('-')]
+            res.extend(range(s, e + 1))
+    return res
 
 
 def cmd(args: argparse.Namespace) -> bool:
     if args.subparserName == 'cfStressTest':
         if args.N <= 0:
             return True
+        os.makedirs(compiler.tempBinariesDirectory, exist_ok=True)
         slnPath = os.path.join(compiler.tempBinariesDirectory, f'problem{args.problemId}_{time.time_ns()}solution.cpp')
         with open(slnPath, 'w+') as slnFs:
             print('Downloading problem solution.')
             slnFs.write(dbMan.ProblemSln.cfLoadProblemSln(args.problemId).source)
             print('Done downloading.')
             slnFs.flush()
-        stressTest(args.source, args.N, args.generator, f'problem{args.problemId}_{time.time_ns()}_FailedTestCase.txt', args.validator, slnPath)
+        prob = dbMan.Problem.getByUserId(args.problemId)
+        stressTest(args.source, args.N, args.generator, f'problem{args.problemId}_{time.time_ns()}_FailedTestCase.txt', args.validator, slnPath, args.jobs, args.seed,
+                   *problemLimits(prob, args.timeLimit, args.memoryLimit), args.outputLimit, args.checker, args.persistentValidator,
+                   args.minimize or args.saveMinimized, args.problemId if args.saveMinimized else None, args.batch,
+                   None if prob == None or args.noCorpus else prob.id)
         os.remove(slnPath)
         return True
 
     if args.subparserName == 'stressTest':
         if args.N <= 0:
             return True
-        stressTest(args.source, args.N, args.generator, f'problem{args.problemId}_{time.time_ns()}_FailedTestCase.txt', args.validator, _sep)
+        prob = dbMan.Problem.getByUserId(args.problemId)
+        stressTest(args.source, args.N, args.generator, f'problem{args.problemId}_{time.time_ns()}_FailedTestCase.txt', args.validator, args.solver, args.jobs, args.seed,
+                   *problemLimits(prob, args.timeLimit, args.memoryLimit), args.outputLimit, args.checker, args.persistentValidator,
+                   args.minimize or args.saveMinimized, args.problemId if args.saveMinimized else None, args.batch,
+                   None if prob == None or args.noCorpus else prob.id)
         return True
 
     if args.subparserName == 'test':
-        def splitTestsIds(strList: str) -> List[int]:
-            res = []
-            for i in (i.strip() for i in strList.split(',')):
-                if ''.find('-') == -1:
-                    res.append(int(i))
-                else:
-                    s, e = [int(j.strip()) for j in i.split('-')]
-                    res.extend(range(s, e + 1))
-            return res
         cfTestsIds = splitTestsIds(args.cfTests) if args.cfTests else None
         uTestsIds = splitTestsIds(args.uTests) if args.uTests else None
         val = args.validator if args.validator else None
-        testProblem(args.problemId, args.source, cfTestsIds, uTestsIds, val)
+        testProblem(args.problemId, args.source, cfTestsIds, uTestsIds, val, args.jobs, args.timeLimit, args.memoryLimit, args.outputLimit, args.checker, args.persistentValidator,
+                    args.failFast)
+        return True
+
+    if args.subparserName == 'watch':
+        cfTestsIds = splitTestsIds(args.cfTests) if args.cfTests else None
+        uTestsIds = splitTestsIds(args.uTests) if args.uTests else None
+        watchProblem(args.problemId, args.source, cfTestsIds, uTestsIds, args.validator, args.jobs, args.timeLimit, args.memoryLimit, args.outputLimit, args.checker,
+                     args.persistentValidator)
         return True
 
     return False
 
 
+def _addStressArguments(p: argparse.ArgumentParser):
+    p.add_argument('--jobs', type=int,
+                   help='Number of iterations to run in parallel, each one pinned to its own core, by default its the number of available cores.')
+    p.add_argument('--seed', type=int,
+                   help='Base seed of the run, iteration i passes seed + i to the generator in the environment variable CFTESTER_SEED. By default its random.')
+    p.add_argument('--minimize', action='store_true',
+                   help='Shrink a failed case by removing lines and tokens of its input while it still fails the same way, the result is written next to the failed case file.')
+    p.add_argument('--saveMinimized', action='store_true', help='Also save the minimized case as a U test of the problem, implies --minimize.')
+    p.add_argument('--batch', type=int, default=1,
+                   help='For multi-case problems, pack this many generated cases into one input that starts with their count so the solution and solver '
+                   'run once per batch. The generator gets argument --count and should print that many records of test case, answer and additional data each followed by '
+                   '--seperator, record j being the case it prints for seed CFTESTER_SEED + j, otherwise its called once per case. '
+                   "The limits apply to the whole batch and a failed batch is bisected to its failing case, it can't be used with --validator. "
+                   'By default its 1 which runs cases as they are.')
+    p.add_argument('--noCorpus', action='store_true',
+                   help="Don't replay or grow the problem corpus, which keeps generated cases along with the solver answers so later runs replay them first "
+                   'and skip the solver for inputs it already answered. The corpus is only used with a solver and without --batch, '
+                   f'it keeps the {dbMan.Corpus.CORPUS_SIZE} most recently used cases of every problem, set CFTESTER_CORPUS_SIZE to change that.')
+    _addLimitsArguments(p)
+
+
+def addTestsArguments(p: argparse.ArgumentParser):
+    p.add_argument('--cfTests',
+                   help="Numbers of CF tests you want to run seperated by a comma and can include ranges and non-existing tasks numbers, ex: 1,2,4-6,10,13. If omitted then all will be tested.")
+    p.add_argument('--uTests',
+                   help="Numbers of User tests you want to run seperated by a comma and can include ranges and non-existing tasks numbers, ex: 1,2,4-6,10,13. If omitted then all will be tested.")
+
+
+def _addLimitsArguments(p: argparse.ArgumentParser):
+    p.add_argument('--timeLimit', type=int,
+                   help=f'Time limit in ms of CPU time, by default its the problem time limit or {DEFAULT_TIME_LIMIT}ms.')
+    p.add_argument('--memoryLimit', type=int,
+                   help=f'Memory limit in MB, exceeding it gives a "Memory limit exceeded" verdict, by default its the problem memory limit or {DEFAULT_MEMORY_LIMIT}MB.')
+    p.add_argument('--outputLimit', type=int, default=DEFAULT_OUTPUT_LIMIT,
+                   help=f'Output limit in MB, exceeding it gives an "Output limit exceeded" verdict, by default its {DEFAULT_OUTPUT_LIMIT}MB.')
+    p.add_argument('--checker', default='exact',
+                   help='Built-in checker used when there is no validator: ' + ' '.join(f'{k}: {v}' for k, v in checkers.CHECKERS.items()))
+    p.add_argument('--persistentValidator', action='store_true',
+                   help='Launch the validator once with the argument --persistent and feed it all of the checks over STDIN, each check is input, output, answer and additional data '
+                   'where every field is framed as "<byte length>\\n<bytes>", for each check it must print "<exit code> <comment byte length>\\n<comment bytes>" and flush. '
+                   'It will be restarted if it crashes.')
+
+
 def addParser(p: argparse._SubParsersAction):
     pCFStressTest = p.add_parser('cfStressTest',
                                  description='Stress test a CF problem, by downloading any cpp solution then feeding it your generator test case after that it will compare CF solution to your\'s.')
@@ -198,6 +796,7 @@ def addParser(p: argparse._SubParsersAction):
                                help='Path to your generator file, it must print the test case, answer(mostly empty), additional data for validator(can be empty) all separated by argument --seperator.')
     pCFStressTest.add_argument('--validator',
                                help='Path to your validator file, it will receive test case, your solution answer, CF solution answer, additional data from generator(can be empty) all separated by argument --seperator.\nIts exit code should be 0 if answer is correct and non-zero otherwise also in case of not accepted STDOUT can contain a comment.')
+    _addStressArguments(pCFStressTest)
 
     pStressTest = p.add_parser('stressTest',
                                description='Stress test a non-CF problem, by feeding it your generator test case after that it will feed case and output to validator.')
@@ -208,15 +807,29 @@ def addParser(p: argparse._SubParsersAction):
                              help='Path to your generator file, it must print the test case, answer(can\'t be empty unless you provided a validator), additional data for validator(can be empty) all separated by argument --seperator.')
     pStressTest.add_argument('--validator',
                              help='Path to your validator file, it will receive test case, your solution answer, generator answer(can be empty), additional data from generator(can be empty) all separated by argument --seperator.\nIts exit code should be 0 if answer is correct and non-zero otherwise.')
+    pStressTest.add_argument('--solver', help='Path to a reference solution, its answer to each test case replaces the generator answer.')
+    _addStressArguments(pStressTest)
 
     pTest = p.add_parser('test', description='Runs a group of saved tests in the db against your solution.')
     pTest.add_argument('problemId',
                        help='Id of the problem to test.')
     pTest.add_argument('source',
                        help='Path to your solution file.')
-    pTest.add_argument('--cfTests',
-                       help="Numbers of CF tests you want to run seperated by a comma and can include ranges and non-existing tasks numbers, ex: 1,2,4-6,10,13. If omitted then all will be tested.")
-    pTest.add_argument('--uTests',
-                       help="Numbers of User tests you want to run seperated by a comma and can include ranges and non-existing tasks numbers, ex: 1,2,4-6,10,13. If omitted then all will be tested.")
+    addTestsArguments(pTest)
     pTest.add_argument('--validator',
                        help='Path to your validator file, it will receive test case, your solution answer, expected answer, additional data(empty for now) all separated by argument --seperator.\nIts exit code should be 0 if answer is correct and non-zero otherwise.')
+    pTest.add_argument('--jobs', type=int,
+                       help='Number of tests to run in parallel, each one pinned to its own core, by default its the number of available cores.')
+    pTest.add_argument('--failFast', action='store_true',
+                       help='Stop at the first failed test. Tests that failed recently and cheap tests run first either way, so a wrong solution usually fails early.')
+    _addLimitsArguments(pTest)
+
+    pWatch = p.add_parser('watch', description='Runs the saved tests against your solution every time it or the validator is saved, the tests that failed last time run first '
+                          'and a save while tests are running cancels them. Stop it with Ctrl+C.')
+    pWatch.add_argument('problemId', help='Id of the problem to test.')
+    pWatch.add_argument('source', help='Path to your solution file.')
+    addTestsArguments(pWatch)
+    pWatch.add_argument('--validator', help='Path to your validator file, same as the test command validator.')
+    pWatch.add_argument('--jobs', type=int,
+                        help='Number of tests to run in parallel, each one pinned to its own core, by default its the number of available cores.')
+    _addLimitsArguments(pWatch)
@@ -0,0 +1,108 @@
+import os
+import time
+import threading
+import functools
+from typing import Dict
+
+# Records how long the phases of a run take, like compiling, running the generator, the solver, the solution, the validator and db access.
+# Its off unless enable is called, in which case span and traced cost a global lookup and a call.
+_events: list = None
+_threads: Dict[int, str] = {}
+_started = 0
+FORMATS = ('chrome', 'summary')
+
+
+class _Span:
+    __slots__ = 'name', 'category', 'start'
+
+    def __init__(self, name: str, category: str):
+        self.name, self.category = name, category
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *args):
+        end = time.perf_counter_ns()
+        tid = threading.get_native_id()
+        if tid not in _threads:
+            _threads[tid] = threading.current_thread().name
+        # list.append is atomic so workers don't need a lock
+        _events.append((self.name, self.category, tid, self.start, end - self.start))
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+_noSpan = _NoSpan()
+
+
+def enable():
+    'Starts recording, spans before this call are not recorded.'
+    global _events, _started
+    _events, _started = [], time.perf_counter_ns()
+
+
+def enabled() -> bool:
+    return _events != None
+
+
+def span(name: str, category: str = 'run'):
+    'Context manager that records the time spent inside it under name.'
+    return _noSpan if _events == None else _Span(name, category)
+
+
+def traced(category: str):
+    'Decorator that records every call of the function under its qualified name.'
+    def decorator(fn):
+        name = fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _events == None:
+                return fn(*args, **kwargs)
+            with _Span(name, category):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def summary() -> dict:
+    """Returns the wall time of the run and the count, total, mean and max duration of every phase, all in ms.
+    Phases of parallel workers overlap so their totals can add up to more than the wall time."""
+    phases = {}
+    for name, category, _, _, duration in _events:
+        p = phases.get(name)
+        if p == None:
+            p = phases[name] = {'category': category, 'count': 0, 'total': 0, 'max': 0}
+        p['count'] += 1
+        p['total'] += duration
+        p['max'] = max(p['max'], duration)
+    for p in phases.values():
+        p['mean'] = round(p['total'] / p['count'] / 1e6, 3)
+        p['total'], p['max'] = round(p['total'] / 1e6, 3), round(p['max'] / 1e6, 3)
+    return {'wall': round((time.perf_counter_ns() - _started) / 1e6, 3),
+            'phases': dict(sorted(phases.items(), key=lambda p: p[1]['total'], reverse=True))}
+
+
+def chromeTrace() -> dict:
+    'Returns the spans as a Chrome trace event file, open it in chrome://tracing or ui.perfetto.dev.'
+    pid = os.getpid()
+    events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid, 'args': {'name': name}} for tid, name in _threads.items()]
+    events.extend({'name': name, 'cat': category, 'ph': 'X', 'pid': pid, 'tid': tid, 'ts': (start - _started) / 1000, 'dur': duration / 1000}
+                  for name, category, tid, start, duration in _events)
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def write(path: str, format: str = 'chrome'):
+    'format is one of FORMATS.'
+    import json
+    with open(path, 'w') as f:
+        json.dump(chromeTrace() if format == 'chrome' else summary(), f, indent=None if format == 'chrome' else 2)
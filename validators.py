@@ -0,0 +1,168 @@
+import os
+import subprocess
+import threading
+import logging
+import tempfile
+from typing import Dict, Tuple
+import runner
+
+# Persistent validators are launched once with the argument --persistent and receive many records over STDIN,
+# each record is input, output, answer and additional data where every field is framed as "<byte length>\n<bytes>".
+# For each record the validator must print "<exit code> <comment byte length>\n<comment bytes>" and flush its STDOUT,
+# exit code 0 means the answer is correct.
+# seconds a persistent validator may take to reply to a record before its considered hung, killed and restarted
+REPLY_TIMEOUT = float(os.environ.get('CFTESTER_VALIDATOR_TIMEOUT', 30))
+# bytes of the end of a persistent validator stderr shown when it crashes or hangs
+KEPT_STDERR = 2048
+
+
+def runOnce(validator: list, parts: list, cpu: int = None) -> Tuple[int, str]:
+    'Starts the validator, streams all of the parts to its stdin, returns its exit code and output.'
+    proc = subprocess.Popen(validator, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    runner.pin(proc.pid, cpu)
+
+    def write():
+        try:
+            for p in parts:
+                runner.writeChunks(proc.stdin, '' if p == None else p)
+        except (BrokenPipeError, OSError):
+            pass
+        finally:
+            try:
+                proc.stdin.close()
+            except (BrokenPipeError, OSError):
+                pass
+    writer = threading.Thread(target=write, daemon=True)
+    writer.start()
+    output = proc.stdout.read()
+    proc.wait()
+    writer.join()
+    return proc.returncode, output.decode('utf8', errors='replace')
+
+
+def _payloadSize(data) -> int:
+    'Size in bytes of str, bytes-like or a seekable binary file from its current position.'
+    if data == None:
+        return 0
+    if isinstance(data, str):
+        return sum(len(data[i:i + runner.CHUNK_SIZE].encode('utf8')) for i in range(0, len(data), runner.CHUNK_SIZE))
+    view = runner.asBuffer(data)
+    if view != None:
+        return len(view)
+    if hasattr(data, 'size'):
+        return data.size
+    pos = data.tell()
+    size = data.seek(0, os.SEEK_END) - pos
+    data.seek(pos)
+    return size
+
+
+class _PersistentProcess:
+    'The validator stderr goes to a temporary file so it never mixes with the tester output, its end is reported when the validator crashes or hangs.'
+    __slots__ = 'args', 'cpu', 'proc', 'stderr', 'timedOut'
+
+    def __init__(self, args: list, cpu: int):
+        self.args, self.cpu, self.proc, self.stderr, self.timedOut = args, cpu, None, None, False
+
+    def _start(self):
+        self.stderr = tempfile.TemporaryFile()
+        self.proc = subprocess.Popen(self.args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=self.stderr)
+        runner.pin(self.proc.pid, self.cpu)
+
+    def _kill(self):
+        self.timedOut = True
+        try:
+            self.proc.kill()
+        except ProcessLookupError:
+            pass
+
+    def _check(self, parts: list) -> Tuple[int, str]:
+        if self.proc == None or self.proc.poll() != None:
+            self.close()
+            self._start()
+        # a hung validator is killed which makes the pending write or read fail
+        self.timedOut = False
+        watchdog = threading.Timer(REPLY_TIMEOUT, self._kill)
+        watchdog.start()
+        try:
+            for p in parts:
+                self.proc.stdin.write(f'{_payloadSize(p)}\n'.encode('utf8'))
+                runner.writeChunks(self.proc.stdin, p)
+            self.proc.stdin.flush()
+            header = self.proc.stdout.readline().split()
+            if len(header) != 2:
+                raise EOFError('Validator sent a malformed reply header.')
+            code, commentSize = int(header[0]), int(header[1])
+            comment = self.proc.stdout.read(commentSize)
+            if len(comment) != commentSize:
+                raise EOFError('Validator reply was cut short.')
+        finally:
+            watchdog.cancel()
+        return code, comment.decode('utf8', errors='replace')
+
+    def _stderrTail(self) -> str:
+        if self.stderr == None:
+            return ''
+        self.stderr.seek(max(0, self.stderr.seek(0, os.SEEK_END) - KEPT_STDERR))
+        return self.stderr.read().decode('utf8', errors='replace').strip()
+
+    def check(self, parts: list) -> Tuple[int, str]:
+        """If the validator crashes it will be restarted and the record will be retried once,
+        if it doesn't reply within REPLY_TIMEOUT seconds its restarted and the record fails without a retry."""
+        for attempt in range(2):
+            try:
+                return self._check(parts)
+            except (BrokenPipeError, ConnectionResetError, EOFError, ValueError) as er:
+                timedOut, stderr = self.timedOut, self._stderrTail()
+                self.close()
+                if timedOut:
+                    er = f'no reply within {REPLY_TIMEOUT:g}s'
+                logging.warning(f'Persistent validator {"hung" if timedOut else "crashed"} ({er}), restarting it.' + (f' Its stderr ends with:\n{stderr}' if stderr else ''))
+                for p in parts:
+                    if hasattr(p, 'seek') and runner.asBuffer(p) == None:
+                        p.seek(0)
+                if timedOut:
+                    return 1, f'Validator hung: {er}\n{stderr}'.strip()
+                if attempt == 1:
+                    return 1, f'Validator crashed: {er}\n{stderr}'.strip()
+
+    def close(self):
+        if self.proc == None:
+            return
+        try:
+            self.proc.stdin.close()
+        except (BrokenPipeError, OSError):
+            pass
+        try:
+            self.proc.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+        self.proc.stdout.close()
+        self.stderr.close()
+        self.proc, self.stderr = None, None
+
+
+class PersistentValidator:
+    """Keeps one validator process per core (or a single one when no core is given) and feeds it records using the framed protocol.
+    Each core is owned by a single worker at a time so its process is never shared between concurrent checks."""
+
+    def __init__(self, validator: list):
+        self.args = list(validator) + ['--persistent']
+        self._processes: Dict[int, _PersistentProcess] = {}
+        self._locks: Dict[int, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def check(self, input, output, answer, additionalData, cpu: int = None) -> Tuple[int, str]:
+        with self._lock:
+            if cpu not in self._processes:
+                self._processes[cpu], self._locks[cpu] = _PersistentProcess(self.args, cpu), threading.Lock()
+            proc, lock = self._processes[cpu], self._locks[cpu]
+        with lock:
+            return proc.check([input, output, answer, additionalData])
+
+    def close(self):
+        with self._lock:
+            for p in self._processes.values():
+                p.close()
+            self._processes.clear()